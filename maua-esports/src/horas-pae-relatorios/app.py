@@ -1,8 +1,24 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from horas_pae_reporter import HorasPaeReporter
+from snapshot_cache import snapshot_cache
+from shared_snapshot import shared_snapshots
+from user_cache import user_cache
+from refresher import refresher
+from upstream_client import get_upstream_client
+from report_cache import RenderedReport, report_cache, report_key, report_etag
+from singleflight import data_fetches, report_renders
+from rollups import parse_period, current_rollup_index, reset_rollup_index
+from train_aggregator import reset_incremental_aggregators
+from report_jobs import report_jobs, QueueFullError
+from bundle_export import BUNDLE_FORMATS, bundle_teams, iter_bundle
+from data_export import EXPORT_FORMATS, export_teams, export_rows, iter_csv, iter_ndjson, write_parquet
+from diagnostics import diagnostics
+from metrics import registry, http_request_seconds, report_bytes, start_request_timing, request_timings, server_timing_header
 from config import Config
 import io
+import os
+import time
 import traceback
 import logging
 
@@ -15,12 +31,159 @@ app = Flask(__name__)
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
-        "methods": ["OPTIONS", "POST"],
-        "allow_headers": ["Authorization", "Content-Type"]
+        "methods": ["OPTIONS", "GET", "POST"],
+        "allow_headers": ["Authorization", "Content-Type", "If-None-Match"],
+        "expose_headers": ["ETag", "Last-Modified", "Content-Disposition", "Server-Timing"]
     }
 })
 app.config.from_object(Config)
 
+@app.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    start_request_timing()
+
+@app.after_request
+def record_timing(response):
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_request_seconds.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    # Em respostas em streaming o total cobre só até o início do envio do corpo
+    response.headers['Server-Timing'] = server_timing_header(request_timings() + [('total', elapsed)])
+    return response
+
+@registry.collector
+def cache_metrics():
+    snapshots = snapshot_cache.stats()
+    reports = report_cache.stats()
+    jobs = report_jobs.stats()
+    users = user_cache.stats()
+    return [
+        ('horas_pae_snapshot_cache_entries', 'Snapshots de dados em cache.', [({}, snapshots['entries'])]),
+        ('horas_pae_snapshot_cache_requests', 'Consultas ao cache de snapshots (acumulado).',
+            [({'result': 'hit'}, snapshots['hits']), ({'result': 'miss'}, snapshots['misses']), ({'result': 'stale'}, snapshots['stale_hits'])]),
+        ('horas_pae_report_cache_bytes', 'Bytes de relatórios renderizados em cache.', [({}, reports['bytes'])]),
+        ('horas_pae_report_cache_entries', 'Relatórios renderizados em cache.', [({}, reports['entries'])]),
+        ('horas_pae_report_cache_requests', 'Consultas ao cache de relatórios (acumulado).',
+            [({'result': 'hit'}, reports['hits']), ({'result': 'miss'}, reports['misses'])]),
+        ('horas_pae_user_cache_entries', 'Usuários em cache, por tipo de entrada.',
+            [({'kind': 'positive'}, users['entries'] - users['negative_entries']), ({'kind': 'negative'}, users['negative_entries'])]),
+        ('horas_pae_user_cache_lookups', 'Consultas de Discord IDs ao cache de usuários (acumulado).',
+            [({'result': 'hit'}, users['hits']), ({'result': 'miss'}, users['misses']), ({'result': 'stale'}, users['stale_served'])]),
+        ('horas_pae_singleflight_calls', 'Chamadas agrupadas pelo single-flight (acumulado).', [
+            ({'group': group, 'result': result}, stats[field])
+            for group, stats in (('data_fetch', data_fetches.stats()), ('report_render', report_renders.stats()))
+            for result, field in (('executed', 'executions'), ('shared', 'shared'))
+        ]),
+        ('horas_pae_report_jobs_pending', 'Jobs de relatório na fila ou em execução.', [({}, jobs['pending'])]),
+        ('horas_pae_report_jobs_bytes', 'Bytes de resultados de jobs de relatório guardados.', [({}, jobs['bytes'])]),
+    ]
+
+def is_authorized():
+    return request.headers.get('Authorization') == 'Bearer frontendmauaesports'
+
+def request_period(params):
+    """Período pedido (semester ou start_date/end_date); ValueError se inválido, None se ausente."""
+    return parse_period(params.get('semester'), params.get('start_date'), params.get('end_date'))
+
+def load_reporter(period=None):
+    """Reporter com os dados do período pedido; sem período, os do semestre atual."""
+    reporter = HorasPaeReporter()
+    if period is None or period[2] == reporter.semestre_atual:
+        reporter.fetch_data()
+        return reporter
+    if reporter.store:
+        # load_period lê o SQLite, que fetch_data mantém atualizado
+        reporter.fetch_data()
+    else:
+        # Só o período foi pedido: o semestre atual não é buscado nem processado
+        reporter.load_modalities()
+    reporter.load_period(*period)
+    return reporter
+
+def bad_request(e):
+    return jsonify({'error': str(e)}), 400
+
+REPORT_FORMATS = {
+    'pdf': 'application/pdf',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def render_shared(key, fmt, teams, reporter):
+    """
+    Renderiza o relatório uma única vez para todas as requisições simultâneas com a
+    mesma chave e grava o resultado no cache. Retorna um RenderedReport ou, para XLSX
+    maiores que o cache, o arquivo temporário; como um arquivo aberto não pode ser
+    compartilhado, quem aproveitou a chamada de outra requisição gera o seu.
+    """
+    def render():
+        if fmt == 'xlsx':
+            output = reporter.generate_excel_file(teams)
+            size = os.fstat(output.fileno()).st_size
+            report_bytes.observe(size, format=fmt)
+            if size > report_cache.max_bytes:
+                return output
+            with output:
+                return report_cache.put(key, output.read(), reporter.data_updated_at)
+        cached = report_cache.put(key, reporter.generate_pdf(teams), reporter.data_updated_at)
+        report_bytes.observe(len(cached.data), format=fmt)
+        return cached
+
+    result, shared = report_renders.do(key, render)
+    if shared and not isinstance(result, RenderedReport):
+        return reporter.generate_excel_file(teams)
+    return result
+
+def render_report(fmt, teams, reporter):
+    """Renderiza o relatório (ou reaproveita o cache de documentos renderizados)."""
+    key = report_key(fmt, teams, reporter.semestre_atual, reporter.data_version)
+    cached = report_cache.get(key)
+    if cached is not None:
+        logger.info("Serving cached %s report", fmt)
+        return cached
+    result = render_shared(key, fmt, teams, reporter)
+    if isinstance(result, RenderedReport):
+        return result
+    with result:
+        return RenderedReport(result.read(), report_etag(key), reporter.data_updated_at)
+
+def send_report(fmt, teams, reporter, download_name):
+    """
+    Envia um relatório usando o cache de documentos renderizados. Responde 304 quando
+    o If-None-Match do cliente já corresponde aos mesmos times, semestre e versão dos dados.
+    XLSX maiores que o cache são enviados direto do arquivo temporário, em partes.
+    """
+    key = report_key(fmt, teams, reporter.semestre_atual, reporter.data_version)
+    etag = report_etag(key)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    cached = report_cache.get(key)
+    if cached is not None:
+        logger.info("Serving cached %s report", fmt)
+    else:
+        result = render_shared(key, fmt, teams, reporter)
+        if not isinstance(result, RenderedReport):
+            return attachment_response(result, fmt, download_name, etag, reporter.data_updated_at)
+        cached = result
+
+    return attachment_response(io.BytesIO(cached.data), fmt, download_name, cached.etag, cached.last_modified)
+
+def attachment_response(fileobj, fmt, download_name, etag, last_modified):
+    response = send_file(
+        fileobj,
+        mimetype=REPORT_FORMATS[fmt],
+        as_attachment=True,
+        download_name=download_name,
+        last_modified=last_modified,
+        etag=False
+    )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/generate-pdf-report', methods=['POST', 'OPTIONS'])
 def generate_pdf():
     if request.method == 'OPTIONS':
@@ -28,8 +191,7 @@ def generate_pdf():
         
     try:
         # Verify authorization
-        auth_header = request.headers.get('Authorization')
-        if auth_header != 'Bearer frontendmauaesports':
+        if not is_authorized():
             logger.warning("Unauthorized access attempt")
             return jsonify({'error': 'Unauthorized'}), 401
 
@@ -38,21 +200,22 @@ def generate_pdf():
             logger.error("Missing team parameter")
             return jsonify({'error': 'Missing team parameter'}), 400
             
-        logger.info(f"Generating PDF report for team: {data['team']}")
-        reporter = HorasPaeReporter()
-        reporter.fetch_data()
-        
-        pdf_data = reporter.generate_pdf(data['team'])
-        logger.info("PDF generated successfully")
+        try:
+            period = request_period(data)
+        except ValueError as e:
+            return bad_request(e)
+
+        logger.info("Generating PDF report for team: %s", data['team'])
+        reporter = load_reporter(period)
         
-        return send_file(
-            io.BytesIO(pdf_data),
-            mimetype='application/pdf',
-            as_attachment=True,
+        return send_report(
+            'pdf',
+            data['team'],
+            reporter,
             download_name=f"relatorio_pae_{data['team']}_{reporter.semestre_atual}.pdf"
         )
     except Exception as e:
-        logger.error(f"Error generating PDF: {str(e)}")
+        logger.error("Error generating PDF: %s", e)
         traceback.print_exc()
         return jsonify({
             'error': str(e),
@@ -66,34 +229,404 @@ def generate_excel():
         
     try:
         # Verify authorization
-        auth_header = request.headers.get('Authorization')
-        if auth_header != 'Bearer frontendmauaesports':
+        if not is_authorized():
             return jsonify({'error': 'Unauthorized'}), 401
 
         data = request.get_json()
         if not data or 'team' not in data:
             return jsonify({'error': 'Missing team parameter'}), 400
             
-        logger.info(f"Generating Excel report for team: {data['team']}")
-        reporter = HorasPaeReporter()
-        reporter.fetch_data()
-        
-        excel_data = reporter.generate_excel(data['team'])
-        logger.info("Excel generated successfully")
+        try:
+            period = request_period(data)
+        except ValueError as e:
+            return bad_request(e)
+
+        logger.info("Generating Excel report for team: %s", data['team'])
+        reporter = load_reporter(period)
         
-        return send_file(
-            io.BytesIO(excel_data),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
+        return send_report(
+            'xlsx',
+            data['team'],
+            reporter,
             download_name=f"relatorio_pae_{data['team']}_{reporter.semestre_atual}.xlsx"
         )
     except Exception as e:
-        logger.error(f"Error generating Excel: {str(e)}")
+        logger.error("Error generating Excel: %s", e)
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'trace': traceback.format_exc()
+        }), 500
+
+@app.route('/api/generate-bundle-report', methods=['POST', 'OPTIONS'])
+def generate_bundle():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+
+    try:
+        if not is_authorized():
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        data = request.get_json()
+        if not data or 'team' not in data:
+            return jsonify({'error': 'Missing team parameter'}), 400
+        formats = data.get('formats', ['pdf'])
+        if not formats or any(fmt not in BUNDLE_FORMATS for fmt in formats):
+            return jsonify({'error': f'Formats must be a subset of {list(BUNDLE_FORMATS)}'}), 400
+        try:
+            period = request_period(data)
+        except ValueError as e:
+            return bad_request(e)
+
+        reporter = load_reporter(period)
+        teams = bundle_teams(reporter.times_data, data['team'])
+        if not teams:
+            return jsonify({'error': f"Nenhum time válido encontrado: {data['team']}"}), 400
+
+        logger.info("Generating bundle for %s teams (%s)", len(teams), ', '.join(formats))
+        return Response(
+            stream_with_context(iter_bundle(reporter.times_data, reporter.semestre_atual, teams, formats)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename=relatorio_pae_todas_modalidades_{reporter.semestre_atual}.zip'}
+        )
+    except Exception as e:
+        logger.error("Error generating bundle: %s", e)
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'trace': traceback.format_exc()
+        }), 500
+
+@app.route('/api/export/hours', methods=['GET'])
+def export_hours():
+    """
+    Horas por jogador em formato legível por máquina (csv, ndjson ou parquet),
+    com Discord ID, RA, time e data do último treino. Sem ?team=, exporta todos os times.
+    """
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Format must be one of {list(EXPORT_FORMATS)}'}), 400
+    try:
+        period = request_period(request.args)
+    except ValueError as e:
+        return bad_request(e)
+
+    try:
+        reporter = load_reporter(period)
+        teams = export_teams(reporter.times_data, request.args.getlist('team'))
+        if not teams:
+            return jsonify({'error': f"Nenhum time válido encontrado: {request.args.getlist('team')}"}), 400
+
+        etag = report_etag(report_key(f'export-{fmt}', teams, reporter.semestre_atual, reporter.data_version))
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        download_name = f"horas_pae_{reporter.semestre_atual}.{fmt}"
+        rows = export_rows(reporter.times_data, teams)
+        if fmt == 'parquet':
+            output = io.BytesIO()
+            write_parquet(rows, output)
+            report_bytes.observe(output.tell(), format=fmt)
+            output.seek(0)
+            response = send_file(output, mimetype=EXPORT_FORMATS[fmt], as_attachment=True, download_name=download_name, etag=False)
+        else:
+            chunks = iter_csv(rows) if fmt == 'csv' else iter_ndjson(rows)
+            response = Response(
+                stream_with_context(counted(chunks, fmt)),
+                mimetype=EXPORT_FORMATS[fmt],
+                headers={'Content-Disposition': f'attachment; filename={download_name}'}
+            )
+        response.set_etag(etag)
+        response.last_modified = reporter.data_updated_at
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        logger.error("Error exporting hours: %s", e)
         traceback.print_exc()
         return jsonify({
             'error': str(e),
             'trace': traceback.format_exc()
         }), 500
 
+def int_arg(name, default, maximum=None):
+    """Parâmetro inteiro não negativo da query string; ValueError se inválido."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} deve ser um inteiro")
+    if value < 0:
+        raise ValueError(f"{name} deve ser maior ou igual a zero")
+    return min(value, maximum) if maximum is not None else value
+
+def query_model():
+    """
+    Valida período e paginação e carrega o modelo compacto dos dados pedidos.
+    Retorna (reporter, limit, offset, erro); erro é uma resposta 400 pronta quando os
+    parâmetros são inválidos, e os demais valores são None nesse caso.
+    """
+    try:
+        period = request_period(request.args)
+        limit = int_arg('limit', 10, 1000)
+        offset = int_arg('offset', 0)
+    except ValueError as e:
+        return None, None, None, bad_request(e)
+    return load_reporter(period), limit, offset, None
+
+def model_response(reporter, payload):
+    return jsonify({
+        'semester': reporter.semestre_atual,
+        'version': reporter.data_version,
+        **payload
+    }), 200
+
+@app.route('/api/players/<player_id>', methods=['GET'])
+def player_hours(player_id):
+    """Horas, time e posições de um jogador, buscado por Discord ID ou RA."""
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        reporter, _, _, error = query_model()
+        if error:
+            return error
+        player = reporter.model.find_player(player_id)
+        if player is None:
+            return jsonify({'error': f'Jogador não encontrado: {player_id}'}), 404
+        return model_response(reporter, {'player': player})
+    except Exception as e:
+        logger.error("Error looking up player: %s", e)
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/teams/<team>/ranking', methods=['GET'])
+def team_ranking(team):
+    """Ranking de horas de um time, paginado com offset/limit."""
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        reporter, limit, offset, error = query_model()
+        if error:
+            return error
+        ranking = reporter.model.team_ranking(team, offset, limit)
+        if ranking is None:
+            return jsonify({'error': f'Time não encontrado: {team}'}), 404
+        return model_response(reporter, {'offset': offset, 'limit': limit, **ranking})
+    except Exception as e:
+        logger.error("Error building team ranking: %s", e)
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboard', methods=['GET'])
+def leaderboard():
+    """Top-N jogadores por horas, geral ou de um time (?team=)."""
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        reporter, limit, _, error = query_model()
+        if error:
+            return error
+        team = request.args.get('team')
+        top = reporter.model.top(limit, team)
+        if top is None:
+            return jsonify({'error': f'Time não encontrado: {team}'}), 404
+        return model_response(reporter, {'team': team, 'limit': limit, 'leaderboard': top})
+    except Exception as e:
+        logger.error("Error building leaderboard: %s", e)
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def counted(chunks, fmt):
+    """Repassa os pedaços de uma resposta em streaming e registra o tamanho total no fim."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk.encode('utf-8')) if isinstance(chunk, str) else len(chunk)
+        yield chunk
+    report_bytes.observe(size, format=fmt)
+
+def run_report_job(job):
+    reporter = load_reporter(job.period)
+    job.set_progress(0.5)
+    cached = render_report(job.format, job.teams, reporter)
+    filename = f"relatorio_pae_{job.teams}_{reporter.semestre_atual}.{job.format}"
+    return cached.data, filename, REPORT_FORMATS[job.format]
+
+@app.route('/api/reports/jobs', methods=['POST', 'OPTIONS'])
+def submit_report_job():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json()
+    if not data or 'team' not in data:
+        return jsonify({'error': 'Missing team parameter'}), 400
+    fmt = data.get('format', 'pdf')
+    if fmt not in REPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    try:
+        period = request_period(data)
+    except ValueError as e:
+        return bad_request(e)
+
+    try:
+        job = report_jobs.submit(fmt, data['team'], run_report_job, period)
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    return jsonify({
+        **job.to_dict(),
+        'status_url': f'/api/reports/jobs/{job.id}',
+        'download_url': f'/api/reports/jobs/{job.id}/download'
+    }), 202
+
+@app.route('/api/reports/jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/reports/jobs/<job_id>/download', methods=['GET'])
+def download_report_job(job_id):
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 409
+
+    return send_file(
+        io.BytesIO(job.data),
+        mimetype=job.mimetype,
+        as_attachment=True,
+        download_name=job.filename
+    )
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'snapshots': snapshot_cache.stats(),
+        'reports': report_cache.stats(),
+        'users': user_cache.stats(),
+        'shared_snapshot': shared_snapshots.stats(),
+        'rollups': current_rollup_index().stats() if current_rollup_index() else None,
+        'singleflight': {
+            'data_fetches': data_fetches.stats(),
+            'report_renders': report_renders.stats()
+        }
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/diagnostics', methods=['GET'])
+def diagnostics_summary():
+    """Anomalias nos dados da API: totais por categoria e, por origem, a última execução com exemplos."""
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(diagnostics.summary()), 200
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def upstream_stats():
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(get_upstream_client(Config()).stats()), 200
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """
+    Estado do snapshot do semestre atual e do refresher. Responde 503 só quando o
+    refresher está ativo, o último refresh falhou e não há snapshot dentro de
+    REFRESH_MAX_STALENESS para servir. Sem refresher, os dados são buscados na
+    primeira requisição e a ausência de snapshot não é falha.
+    """
+    reporter = HorasPaeReporter()
+    cache_key = reporter.get_current_semester_bounds()
+    shared_snapshots.sync(cache_key)
+    snapshot = snapshot_cache.peek(cache_key)
+    failing = refresher.running and refresher.last_error is not None and (
+        snapshot is None or snapshot.age() >= refresher.max_staleness
+    )
+    if failing:
+        status = 'failing'
+    elif snapshot is None:
+        status = 'starting' if refresher.running else 'empty'
+    elif snapshot.age() < snapshot_cache.ttl:
+        status = 'ok'
+    else:
+        status = 'stale'
+    return jsonify({
+        'status': status,
+        'semester': reporter.semestre_atual,
+        'snapshot': None if snapshot is None else {
+            'version': snapshot.version,
+            'created_at': snapshot.created_at,
+            'age': snapshot.age(),
+        },
+        'refresher': refresher.status(),
+    }), 503 if failing else 200
+
+@app.route('/api/cache/invalidate', methods=['POST', 'OPTIONS'])
+def invalidate_cache():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    if not is_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    invalidated = snapshot_cache.invalidate()
+    # Os outros workers descartam o snapshot que adotaram ao notar o arquivo removido
+    shared_snapshots.invalidate()
+    cleared = report_cache.clear()
+    # Rollups e agregados incrementais são reconstruídos do zero no próximo fetch, o que
+    # também incorpora treinos anteriores à janela de revisão editados na API
+    reset_rollup_index()
+    reset_incremental_aggregators()
+    refresher.trigger()
+    result = {'invalidated': invalidated, 'reports_cleared': cleared}
+    # O cache de usuários sobrevive à invalidação comum; só é limpo se pedido
+    data = request.get_json(silent=True) or {}
+    if data.get('users'):
+        result['users_cleared'] = user_cache.clear()
+    return jsonify(result), 200
+
+def refresh_snapshot():
+    # Com vários workers, só o eleito busca na API; os demais adotam o snapshot publicado
+    if not shared_snapshots.is_leader():
+        shared_snapshots.sync(HorasPaeReporter().get_current_semester_bounds())
+        return
+    HorasPaeReporter().fetch_data(use_cache=False)
+
+def start_refresher():
+    """
+    Inicia o refresher no processo que atende requisições: no gunicorn pelo hook
+    post_worker_init, no servidor de desenvolvimento pelo bloco __main__. Não roda
+    no import, que também acontece no processo do reloader e nos filhos do pool
+    de bundles (o spawn reimporta app.py como __mp_main__).
+    """
+    return refresher.start(refresh_snapshot)
+
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use gunicorn -c gunicorn.conf.py wsgi:app
+    # Com o reloader, este bloco roda também no processo que só observa os arquivos
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_refresher()
     app.run(port=5000, debug=True)
\ No newline at end of file
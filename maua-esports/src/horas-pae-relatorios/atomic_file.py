@@ -0,0 +1,36 @@
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="wb", prefix=".horas-pae-", suffix="", encoding=None):
+    """
+    Arquivo temporário no diretório de `path`, trocado por `path` (os.replace) ao sair
+    do bloco sem erro: leitores, inclusive de outros processos, nunca veem o arquivo
+    pela metade. Se o bloco falhar, o temporário é apagado e `path` fica como estava.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def private_dir(path):
+    """
+    Cria (se preciso) e retorna o diretório `path` só do usuário do processo (0700).
+    ValueError se ele já existe e outro usuário é dono dele ou pode gravar nele, pois
+    arquivos ali poderiam ter sido trocados.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise ValueError(f"{path} não é um diretório privado deste usuário")
+    return path
@@ -0,0 +1,207 @@
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import closing
+from train_aggregator import train_fingerprint
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS modalities (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trains (
+    id TEXT PRIMARY KEY,
+    modality_id TEXT,
+    status TEXT,
+    start_timestamp INTEGER,
+    fingerprint INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendances (
+    train_id TEXT NOT NULL REFERENCES trains(id) ON DELETE CASCADE,
+    player_id TEXT,
+    entrance_timestamp INTEGER,
+    exit_timestamp INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trains_start_timestamp ON trains(start_timestamp);
+CREATE INDEX IF NOT EXISTS idx_trains_modality_id ON trains(modality_id);
+CREATE INDEX IF NOT EXISTS idx_attendances_player_id ON attendances(player_id);
+CREATE INDEX IF NOT EXISTS idx_attendances_train_id ON attendances(train_id);
+"""
+
+
+class AttendanceStore:
+    """
+    Armazena modalidades, treinos e presenças em um SQLite local para que
+    semestres ou intervalos de datas possam ser consultados sem buscar todo o histórico na API.
+    """
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            with conn:
+                # Arquivos antigos gravavam a modalidade ausente como o texto 'None'
+                conn.execute("UPDATE trains SET modality_id = NULL WHERE modality_id = 'None'")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def save_modalities(self, modalidades):
+        rows = [(str(mod_id), mod["Name"]) for mod_id, mod in modalidades.items()]
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM modalities")
+            conn.executemany("INSERT INTO modalities (id, name) VALUES (?, ?)", rows)
+
+    def load_modalities(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, name FROM modalities").fetchall()
+        return {mod_id: {"_id": mod_id, "Name": name} for mod_id, name in rows}
+
+    def save_trains(self, trains_data):
+        """
+        Grava (upsert) os treinos e suas presenças. Treinos cujo fingerprint não
+        mudou desde a última gravação são ignorados. Retorna quantos foram gravados.
+        """
+        trains_data = [train for train in trains_data if isinstance(train, dict) and train.get("_id") is not None]
+        with closing(self._connect()) as conn, conn:
+            known = self._known_fingerprints(conn, [str(train["_id"]) for train in trains_data])
+            train_rows = []
+            attendance_rows = []
+            for train in trains_data:
+                train_id = str(train["_id"])
+                fingerprint = train_fingerprint(train)
+                if known.get(train_id) == fingerprint:
+                    continue
+                train_rows.append((
+                    train_id,
+                    str(train["ModalityId"]) if train.get("ModalityId") is not None else None,
+                    train.get("Status"),
+                    train.get("StartTimestamp"),
+                    fingerprint,
+                ))
+                attended_players = train.get("AttendedPlayers", [])
+                if not isinstance(attended_players, list):
+                    continue
+                for player in attended_players:
+                    if not isinstance(player, dict):
+                        continue
+                    player_id = player.get("PlayerId")
+                    attendance_rows.append((
+                        train_id,
+                        str(player_id) if player_id is not None else None,
+                        player.get("EntranceTimestamp"),
+                        player.get("ExitTimestamp"),
+                    ))
+
+            conn.executemany("DELETE FROM attendances WHERE train_id = ?", [(row[0],) for row in train_rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO trains (id, modality_id, status, start_timestamp, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?)",
+                train_rows
+            )
+            conn.executemany(
+                "INSERT INTO attendances (train_id, player_id, entrance_timestamp, exit_timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                attendance_rows
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (time.time(),))
+        logger.info("Stored %s new or changed trains (%s attendances)", len(train_rows), len(attendance_rows))
+        return len(train_rows)
+
+    def delete_missing_trains(self, train_ids):
+        """
+        Remove os treinos (e, em cascata, as presenças) cujo _id não está em `train_ids`,
+        a lista completa retornada por /trains/all. Retorna quantos foram removidos.
+        """
+        train_ids = {str(train_id) for train_id in train_ids}
+        if not train_ids:
+            # Uma resposta vazia é mais provavelmente uma falha da API que o fim de todos os treinos
+            logger.warning("Not pruning attendance store: empty train list")
+            return 0
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TEMP TABLE returned_trains (id TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO returned_trains (id) VALUES (?)", ((train_id,) for train_id in train_ids))
+            removed = conn.execute("DELETE FROM trains WHERE id NOT IN (SELECT id FROM returned_trains)").rowcount
+        if removed:
+            logger.info("Removed %s trains no longer returned by the API from attendance store", removed)
+        return removed
+
+    def _known_fingerprints(self, conn, train_ids, chunk_size=500):
+        known = {}
+        for i in range(0, len(train_ids), chunk_size):
+            chunk = train_ids[i:i + chunk_size]
+            known.update(conn.execute(
+                f"SELECT id, fingerprint FROM trains WHERE id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            ))
+        return known
+
+    def synced_at(self):
+        """Momento da última gravação de treinos, ou None se o arquivo ainda não tem dados."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+        return row[0] if row else None
+
+    def load_trains(self, start_date, end_date, modality_ids=None, status="ENDED"):
+        """
+        Reconstrói, no formato de /trains/all, os treinos com StartTimestamp em
+        [start_date, end_date] usando os índices por data e modalidade.
+        """
+        query = (
+            "SELECT t.id, t.modality_id, t.status, t.start_timestamp, "
+            "a.player_id, a.entrance_timestamp, a.exit_timestamp "
+            "FROM trains t LEFT JOIN attendances a ON a.train_id = t.id "
+            "WHERE t.start_timestamp BETWEEN ? AND ? AND t.status = ?"
+        )
+        params = [start_date, end_date, status]
+        if modality_ids:
+            query += f" AND t.modality_id IN ({', '.join('?' for _ in modality_ids)})"
+            params.extend(str(mod_id) for mod_id in modality_ids)
+        query += " ORDER BY t.start_timestamp, t.id, a.rowid"
+
+        trains = {}
+        with closing(self._connect()) as conn:
+            for train_id, modality_id, train_status, start_ts, player_id, entrance_ts, exit_ts in conn.execute(query, params):
+                train = trains.get(train_id)
+                if train is None:
+                    train = trains[train_id] = {
+                        "_id": train_id,
+                        "ModalityId": modality_id,
+                        "Status": train_status,
+                        "StartTimestamp": start_ts,
+                        "AttendedPlayers": []
+                    }
+                if player_id is None and entrance_ts is None and exit_ts is None:
+                    continue
+                player = {}
+                if player_id is not None:
+                    player["PlayerId"] = player_id
+                if entrance_ts is not None:
+                    player["EntranceTimestamp"] = entrance_ts
+                if exit_ts is not None:
+                    player["ExitTimestamp"] = exit_ts
+                train["AttendedPlayers"].append(player)
+        logger.info("Loaded %s trains from attendance store", len(trains))
+        return list(trains.values())
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_attendance_store(path):
+    """Retorna a instância do processo para o arquivo informado, criando o schema na primeira vez."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = AttendanceStore(path)
+        return store
@@ -0,0 +1,7 @@
+"""
+Benchmarks do gerador de relatórios PAE. Rodar a partir de horas-pae-relatorios/:
+
+    python -m benchmarks.run_benchmarks --attendances 10000 100000
+    python -m benchmarks.bench_pdf
+    python -m benchmarks.bench_excel
+"""
@@ -0,0 +1,64 @@
+"""
+Compara o XLSX gerado pelo caminho original (um DataFrame por time + ExcelWriter
+em BytesIO) com o excel_writer em modo write-only, medindo tempo e pico de memória.
+
+Uso (a partir de horas-pae-relatorios/):
+    python -m benchmarks.bench_excel --players 1000 20000 --teams 12 --repeat 3
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import synthetic_times_data  # noqa: E402
+from horas_pae_reporter import HorasPaeReporter  # noqa: E402
+
+
+def measure(render, repeat):
+    render()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--teams", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    print(f"{'players':>8} {'legacy (s)':>11} {'legacy peak':>12} {'stream (s)':>11} {'stream peak':>12}")
+    for players in args.players:
+        reporter = HorasPaeReporter()
+        reporter.times_data = synthetic_times_data(players, args.teams)
+        teams = list(reporter.times_data)
+
+        def streaming():
+            with reporter.generate_excel_file(teams) as output:
+                output.read(64 * 1024)
+
+        legacy_time, legacy_peak = measure(lambda: reporter.generate_excel_legacy(teams), args.repeat)
+        stream_time, stream_peak = measure(streaming, args.repeat)
+        print(
+            f"{players:>8} {legacy_time:>11.3f} {legacy_peak / 2**20:>9.1f} MB"
+            f" {stream_time:>11.3f} {stream_peak / 2**20:>9.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
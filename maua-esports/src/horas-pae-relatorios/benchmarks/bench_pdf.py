@@ -0,0 +1,54 @@
+"""
+Compara o PDF renderizado pelo caminho original (uma chamada de cell por célula,
+fonte completa carregada a cada documento) com o pdf_renderer.
+
+Uso (a partir de horas-pae-relatorios/):
+    python -m benchmarks.bench_pdf --players 1000 5000 --teams 4 --repeat 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import synthetic_times_data  # noqa: E402
+from horas_pae_reporter import HorasPaeReporter  # noqa: E402
+
+
+def measure(render, repeat):
+    render()  # aquecimento: a fonte do caminho novo é preparada uma vez por processo
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--teams", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    warnings.simplefilter("ignore", DeprecationWarning)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    print(f"{'players':>8} {'legacy (s)':>11} {'fast (s)':>9} {'speedup':>8}")
+    for players in args.players:
+        reporter = HorasPaeReporter()
+        reporter.times_data = synthetic_times_data(players, args.teams)
+        teams = list(reporter.times_data)
+        legacy = measure(lambda: reporter.generate_pdf_legacy(teams), args.repeat)
+        fast = measure(lambda: reporter.generate_pdf(teams), args.repeat)
+        print(f"{players:>8} {legacy:>11.3f} {fast:>9.3f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Confere os rollups contra process_data: as horas de cada período montadas pelo
+RollupIndex devem ser as mesmas do processamento direto dos treinos, também
+depois de treinos recentes e antigos (anteriores à janela de revisão) serem
+editados ou removidos na API.
+
+Uso (a partir de horas-pae-relatorios/):
+    python -m benchmarks.check_rollups --attendances 20000
+
+Sai com código 1 se algum período divergir.
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import warnings
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import generate_payloads  # noqa: E402
+from benchmarks.stub_server import StubUpstream  # noqa: E402
+from rollups import day_bounds, semester_days  # noqa: E402
+
+
+def check_periods(trains, modalidades, periods):
+    """Nomes dos períodos em que load_period (rollups) e process_data divergem."""
+    from horas_pae_reporter import HorasPaeReporter
+
+    failures = []
+    for label, (start_day, end_day) in periods.items():
+        via_rollups = HorasPaeReporter()
+        via_rollups.modalidades = modalidades
+        via_rollups.load_period(start_day, end_day, label)
+        direct = HorasPaeReporter()
+        direct.modalidades = modalidades
+        direct.process_data(trains, *day_bounds(start_day, end_day))
+        if via_rollups.times_data != direct.times_data:
+            failures.append(label)
+    return failures
+
+
+def ended_trains(trains):
+    return sorted(
+        (train for train in trains if train["Status"] == "ENDED" and train["AttendedPlayers"]),
+        key=lambda train: train["StartTimestamp"]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attendances", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    payloads = generate_payloads(args.attendances, seed=args.seed)
+    trains = payloads["trains"]
+    with StubUpstream(payloads) as stub:
+        os.environ["API_BASE_URL"] = stub.url
+        os.environ["ATTENDANCE_DB_PATH"] = ""
+        os.environ["ROLLUPS"] = "True"
+        # Cada load_period sincroniza os rollups com a resposta atual do stub
+        os.environ["SNAPSHOT_TTL"] = "0"
+
+        from horas_pae_reporter import HorasPaeReporter
+
+        reporter = HorasPaeReporter()
+        reporter.fetch_data(use_cache=False)
+        modalidades = reporter.modalidades
+        first = date.fromtimestamp(ended_trains(trains)[0]["StartTimestamp"] / 1000)
+        current = semester_days(reporter.semestre_atual)
+        periods = {
+            "current semester": current,
+            "since first train": (first, current[1]),
+            "first month": (first.replace(day=1), semester_days(reporter.semestre_atual)[0]),
+        }
+
+        def scenario(name, edit):
+            edit(trains)
+            stub.set_trains(trains)
+            failures = check_periods(trains, modalidades, periods)
+            print(f"{name:<32} {'ok' if not failures else 'FAILED: ' + ', '.join(failures)}", flush=True)
+            return not failures
+
+        ended = ended_trains(trains)
+        old, recent = ended[len(ended) // 4], ended[-1]
+
+        def edit_old(trains):
+            old["AttendedPlayers"] = old["AttendedPlayers"][:1]
+
+        def delete_old(trains):
+            trains.remove(ended[len(ended) // 3])
+
+        def edit_recent(trains):
+            recent["AttendedPlayers"] = copy.deepcopy(recent["AttendedPlayers"][1:])
+
+        def delete_recent(trains):
+            trains.remove(ended[-2])
+
+        results = [
+            scenario("initial", lambda trains: None),
+            scenario("old train edited", edit_old),
+            scenario("old train deleted", delete_old),
+            scenario("recent train edited", edit_recent),
+            scenario("recent train deleted", delete_recent),
+        ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
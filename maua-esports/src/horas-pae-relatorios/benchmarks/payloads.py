@@ -0,0 +1,99 @@
+"""
+Gera payloads sintéticos no formato de /modality/all, /trains/all e
+/usuarios/por-discord-ids, em escala configurável pelo número de presenças.
+"""
+import random
+from datetime import datetime
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def current_semester_bounds(now=None):
+    """Mesmos limites de HorasPaeReporter.get_current_semester_bounds."""
+    now = now or datetime.now()
+    if now.month <= 6:
+        start, end = datetime(now.year, 1, 1), datetime(now.year, 6, 30, 23, 59, 59)
+    else:
+        start, end = datetime(now.year, 7, 1), datetime(now.year, 12, 31, 23, 59, 59)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def generate_payloads(attendances, players=None, modalities=12, seed=42,
+                      out_of_semester=0.1, not_ended=0.05, malformed=0.01):
+    """
+    Retorna {"modalities", "trains", "users"} com aproximadamente `attendances` presenças.
+
+    Cada jogador tem um time principal e às vezes um segundo time; cada treino
+    tem de 4 a 12 jogadores do elenco da modalidade, com entradas escalonadas e
+    saídas entre 30 min e 3 h depois. Uma fração dos treinos fica fora do semestre,
+    não está ENDED ou tem presenças sem timestamps, como na API real. ~10% dos
+    jogadores não têm usuário cadastrado e saem com o Discord ID no lugar do RA.
+    """
+    rnd = random.Random(seed)
+    players = players or max(attendances // 40, 20)
+    start, end = current_semester_bounds()
+
+    modality_list = [{"_id": f"{i:024x}", "Name": f"Modalidade {i}"} for i in range(modalities)]
+    weights = [1 / (i + 1) for i in range(modalities)]
+
+    rosters = {mod["_id"]: [] for mod in modality_list}
+    for player in range(players):
+        discord_id = str(100000000000000000 + player)
+        main, secondary = rnd.choices(modality_list, weights=weights, k=2)
+        rosters[main["_id"]].append(discord_id)
+        if secondary is not main and rnd.random() < 0.2:
+            rosters[secondary["_id"]].append(discord_id)
+    active = [mod for mod in modality_list if rosters[mod["_id"]]]
+    active_weights = [weights[modality_list.index(mod)] for mod in active]
+
+    trains = []
+    total = 0
+    while total < attendances:
+        modality = rnd.choices(active, weights=active_weights)[0]
+        roster = rosters[modality["_id"]]
+        if rnd.random() < out_of_semester:
+            started = rnd.randint(start - 180 * DAY_MS, start - DAY_MS)
+        else:
+            started = rnd.randint(start, end - 4 * HOUR_MS)
+
+        attended = []
+        for player_id in rnd.sample(roster, min(len(roster), rnd.randint(4, 12))):
+            if rnd.random() < malformed:
+                attended.append({"PlayerId": player_id})
+                continue
+            entrance = started + rnd.randint(0, 20 * 60 * 1000)
+            exit_ = entrance + rnd.randint(HOUR_MS // 2, 3 * HOUR_MS)
+            attended.append({"PlayerId": player_id, "EntranceTimestamp": entrance, "ExitTimestamp": exit_})
+        total += len(attended)
+
+        trains.append({
+            "_id": f"{len(trains):024x}",
+            "ModalityId": modality["_id"],
+            "Status": "RUNNING" if rnd.random() < not_ended else "ENDED",
+            "StartTimestamp": started,
+            "EndTimestamp": started + 3 * HOUR_MS,
+            "AttendedPlayers": attended,
+        })
+
+    users = [
+        {"discordID": str(100000000000000000 + player), "email": f"{24000000 + player}@maua.br"}
+        for player in range(players)
+        if rnd.random() >= 0.1
+    ]
+    return {"modalities": modality_list, "trains": trains, "users": users}
+
+
+def synthetic_times_data(players, teams, seed=42):
+    """times_data pronto, para medir só a renderização dos relatórios."""
+    rnd = random.Random(seed)
+    times_data = {f"Time {i}": {} for i in range(teams)}
+    for player_id in range(players):
+        team = f"Time {rnd.randrange(teams)}"
+        times_data[team][str(player_id)] = {
+            "name": str(20000000 + player_id),
+            "hours": rnd.uniform(0, 120),
+            "team": team,
+            "last_train_date": 0,
+        }
+    return times_data
@@ -0,0 +1,146 @@
+"""
+Mede tempo (mediana) e pico de memória (tracemalloc) das etapas do HorasPaeReporter
+e das rotas Flask, contra um stub local da API alimentado por payloads sintéticos.
+
+Uso (a partir de horas-pae-relatorios/):
+    python -m benchmarks.run_benchmarks --attendances 10000 100000 --repeat 3
+    python -m benchmarks.run_benchmarks --attendances 1000000 --repeat 1 --json resultados.json
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.payloads import generate_payloads  # noqa: E402
+from benchmarks.stub_server import StubUpstream  # noqa: E402
+from rollups import semester_days  # noqa: E402
+
+AUTH_HEADERS = {"Authorization": "Bearer frontendmauaesports"}
+
+
+def measure(run, repeat, setup=None):
+    """Mediana de `repeat` execuções sem tracemalloc e pico de memória de uma execução extra."""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak
+
+
+def previous_semester(semester):
+    year, half = (int(part) for part in semester.split("."))
+    label = f"{year - 1}.2" if half == 1 else f"{year}.1"
+    return (*semester_days(label), label)
+
+
+def route_call(client, method, url, **kwargs):
+    def run():
+        response = client.open(url, method=method, headers=AUTH_HEADERS, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+        response.get_data()
+    return run
+
+
+def run_scale(attendances, args):
+    payloads = generate_payloads(attendances, players=args.players, modalities=args.modalities, seed=args.seed)
+    with StubUpstream(payloads, compress=not args.no_gzip) as stub:
+        os.environ["API_BASE_URL"] = stub.url
+        os.environ["ATTENDANCE_DB_PATH"] = ""
+        os.environ["USER_CACHE_PATH"] = ""
+
+        # Importados depois do ambiente para que os singletons usem o stub
+        from app import app
+        from horas_pae_reporter import HorasPaeReporter
+        from report_cache import report_cache
+        from rollups import reset_rollup_index
+        from snapshot_cache import snapshot_cache
+        from train_aggregator import reset_incremental_aggregators
+        from user_cache import user_cache
+
+        def cold():
+            snapshot_cache.invalidate()
+            report_cache.clear()
+
+        # As escalas rodam no mesmo processo: nada (RAs, rollups, agregadores) passa de uma para a outra
+        cold()
+        user_cache.clear()
+        reset_rollup_index()
+        reset_incremental_aggregators()
+
+        reporter = HorasPaeReporter()
+        reporter.fetch_data(use_cache=False)
+        teams = [team for team, players in reporter.times_data.items() if players]
+        client = app.test_client()
+        period_reporter = HorasPaeReporter()
+        period_reporter.modalidades = reporter.modalidades
+        previous = previous_semester(reporter.semestre_atual)
+
+        stages = [
+            ("fetch_data", lambda: reporter.fetch_data(use_cache=False), None),
+            ("process_data[python]", lambda: reporter.process_data(payloads["trains"], engine="python"), None),
+            ("process_data[vectorized]", lambda: reporter.process_data(payloads["trains"], engine="vectorized"), None),
+            ("load_period[previous semester]", lambda: period_reporter.load_period(*previous), None),
+            ("generate_pdf", lambda: reporter.generate_pdf(teams), None),
+            ("generate_excel", lambda: reporter.generate_excel(teams), None),
+            ("POST /api/generate-pdf-report", route_call(client, "POST", "/api/generate-pdf-report", json={"team": teams}), cold),
+            ("POST /api/generate-pdf-report (warm)", route_call(client, "POST", "/api/generate-pdf-report", json={"team": teams}), None),
+            ("POST /api/generate-excel-report", route_call(client, "POST", "/api/generate-excel-report", json={"team": teams}), cold),
+            ("GET /api/export/hours?format=csv", route_call(client, "GET", "/api/export/hours?format=csv"), cold),
+            ("GET /api/leaderboard?limit=50", route_call(client, "GET", "/api/leaderboard?limit=50"), None),
+            ("GET /api/players/<id>", route_call(client, "GET", f"/api/players/{payloads['users'][0]['discordID']}"), None),
+        ]
+
+        results = []
+        for name, run, setup in stages:
+            if args.only and not any(pattern in name for pattern in args.only):
+                continue
+            seconds, peak = measure(run, args.repeat, setup)
+            results.append({"attendances": attendances, "stage": name, "seconds": seconds, "peak_bytes": peak})
+            print(f"{attendances:>10} {name:<40} {seconds:>9.3f} {peak / 2**20:>9.1f} MB", flush=True)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attendances", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--players", type=int, default=None, help="padrão: attendances / 40")
+    parser.add_argument("--modalities", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-gzip", action="store_true", help="stub responde sem Content-Encoding: gzip")
+    parser.add_argument("--only", nargs="+", help="roda só as etapas cujo nome contém um destes trechos")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    print(f"{'attendances':>10} {'stage':<40} {'time (s)':>9} {'peak':>12}")
+    results = []
+    for attendances in args.attendances:
+        results.extend(run_scale(attendances, args))
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Servidor HTTP local que imita a API de e-sports a partir dos payloads sintéticos.
+Os corpos JSON (e gzip) são serializados uma vez, para medir o cliente e não o stub.
+"""
+import gzip
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubUpstream:
+    def __init__(self, payloads, compress=True):
+        self.compress = compress
+        self._bodies = {
+            "/modality/all": self._encode(payloads["modalities"]),
+            "/trains/all": self._encode(payloads["trains"]),
+        }
+        self._users = {user["discordID"]: user for user in payloads["users"]}
+        self.requests = 0
+        self._server = None
+
+    def set_trains(self, trains):
+        """Troca a resposta de /trains/all, para simular treinos editados ou removidos na API."""
+        self._bodies["/trains/all"] = self._encode(trains)
+
+    def _encode(self, data):
+        body = json.dumps(data).encode("utf-8")
+        return gzip.compress(body, compresslevel=1) if self.compress else body
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                url = urllib.parse.urlparse(self.path)
+                if url.path in stub._bodies:
+                    body = stub._bodies[url.path]
+                elif url.path == "/usuarios/por-discord-ids":
+                    ids = urllib.parse.parse_qs(url.query).get("ids", [""])[0].split(",")
+                    body = stub._encode([stub._users[i] for i in ids if i in stub._users])
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if stub.compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
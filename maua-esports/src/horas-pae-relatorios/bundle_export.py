@@ -0,0 +1,126 @@
+import io
+import os
+import zipfile
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from horas_pae_reporter import HorasPaeReporter, clean_text
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMATS = ("pdf", "xlsx")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_bundle_pool():
+    """
+    Pool de processos compartilhado para renderizar os relatórios de cada time.
+    Usa spawn para não herdar locks das threads do servidor no fork. Sem
+    BUNDLE_WORKERS, os núcleos são divididos entre os workers do servidor, que
+    têm cada um o seu pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = Config()
+            workers = config.BUNDLE_WORKERS or max((os.cpu_count() or 1) // max(config.WEB_CONCURRENCY, 1), 1)
+            logger.info("Starting bundle pool with %s processes", workers)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def discard_bundle_pool(pool):
+    """Descarta um pool quebrado (um processo morreu) para que o próximo pedido crie outro."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_team_report(fmt, team_name, team_data, semestre):
+    """Renderiza o relatório de um único time; executado nos processos do pool."""
+    reporter = HorasPaeReporter()
+    reporter.semestre_atual = semestre
+    reporter.times_data = {team_name: team_data}
+    if fmt == "pdf":
+        return reporter.generate_pdf([team_name])
+    return reporter.generate_excel([team_name])
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino não posicionável para o ZipFile; os bytes escritos são drenados por pop()."""
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def pop(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def bundle_teams(times_data, teams):
+    """Times pedidos que existem e têm jogadores; os demais não entram no pacote."""
+    teams = teams if isinstance(teams, list) else [teams]
+    return [team for team in teams if times_data.get(team)]
+
+
+def _submit_reports(pool, times_data, semestre, teams, formats):
+    futures = {}
+    try:
+        for team in teams:
+            for fmt in formats:
+                futures[pool.submit(render_team_report, fmt, team, times_data[team], semestre)] = (team, fmt)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return futures
+
+
+def iter_bundle(times_data, semestre, teams, formats):
+    """
+    Gera um ZIP com um arquivo por time e formato, renderizados em paralelo no pool
+    de processos. Cada relatório é escrito no ZIP assim que fica pronto e os
+    bytes são repassados imediatamente, sem montar o pacote inteiro em memória.
+    Se um relatório falhar (ou o cliente desconectar), os pendentes são cancelados
+    e o erro interrompe o stream antes do diretório central, então o cliente não
+    recebe um ZIP válido pela metade.
+    """
+    pool = get_bundle_pool()
+    try:
+        futures = _submit_reports(pool, times_data, semestre, teams, formats)
+    except BrokenProcessPool:
+        # Um processo do pool morreu enquanto ele estava ocioso: nada foi enviado ainda, tenta em um novo
+        discard_bundle_pool(pool)
+        pool = get_bundle_pool()
+        futures = _submit_reports(pool, times_data, semestre, teams, formats)
+    stream = _ZipStream()
+    try:
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for future in as_completed(futures):
+                team, fmt = futures[future]
+                archive.writestr(f"relatorio_pae_{clean_text(team, for_excel=True)}_{semestre}.{fmt}", future.result())
+                logger.info("Added %s report for team '%s' to bundle", fmt, team)
+                yield stream.pop()
+    except BrokenProcessPool:
+        logger.error("Bundle pool is broken, discarding it")
+        discard_bundle_pool(pool)
+        raise
+    except BaseException:
+        cancelled = sum(future.cancel() for future in futures)
+        logger.error("Bundle aborted, cancelled %s pending reports", cancelled)
+        raise
+    yield stream.pop()
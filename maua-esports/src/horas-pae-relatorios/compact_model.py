@@ -0,0 +1,168 @@
+import sys
+import logging
+from array import array
+from collections.abc import Mapping
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class CompactModel:
+    """
+    Visão compacta de times_data para consultas: jogadores e times viram índices
+    inteiros, horas e datas ficam em arrays tipados e rankings por time e geral
+    são arrays de índices já ordenados por horas. Montado uma vez por versão dos
+    dados; as consultas não renderizam nem percorrem times_data.
+    """
+    def __init__(self, version=None):
+        self.version = version
+        self.team_names = []
+        self.team_index = {}
+        self.player_ids = []
+        self.player_index = {}
+        self._ra_index = None
+        self.ras = []
+        self.teams = array("H")
+        self.hours = array("d")
+        self.last_train = array("q")
+        self.team_rankings = {}
+        self.team_rank = array("I")
+        self.leaderboard = array("I")
+        self.overall_rank = array("I")
+
+    @classmethod
+    def from_times_data(cls, times_data, version=None):
+        model = cls(version)
+        members = []
+        for team_name, players in times_data.items():
+            team = len(model.team_names)
+            model.team_names.append(sys.intern(team_name))
+            model.team_index[team_name] = team
+            team_members = array("I")
+            for discord_id, player in players.items():
+                index = len(model.player_ids)
+                model.player_ids.append(discord_id)
+                model.player_index[discord_id] = index
+                # Sem usuário cadastrado, "name" é o próprio Discord ID
+                ra = player["name"] if player["name"] != discord_id else None
+                model.ras.append(ra)
+                model.teams.append(team)
+                model.hours.append(player["hours"])
+                # A API às vezes manda StartTimestamp como float; o array guarda ms inteiros
+                model.last_train.append(int(player.get("last_train_date") or 0))
+                team_members.append(index)
+            members.append(team_members)
+
+        hours = model.hours
+        model.team_rank = array("I", bytes(4 * len(model.player_ids)))
+        for team, team_members in enumerate(members):
+            # sorted é estável: empates mantêm a ordem de times_data, como nos relatórios
+            ranking = array("I", sorted(team_members, key=hours.__getitem__, reverse=True))
+            model.team_rankings[team] = ranking
+            for position, index in enumerate(ranking, 1):
+                model.team_rank[index] = position
+
+        model.leaderboard = array("I", sorted(range(len(hours)), key=hours.__getitem__, reverse=True))
+        model.overall_rank = array("I", bytes(4 * len(model.player_ids)))
+        for position, index in enumerate(model.leaderboard, 1):
+            model.overall_rank[index] = position
+        return model
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    @property
+    def ra_index(self):
+        """Índice por RA, montado só na primeira busca por RA."""
+        if self._ra_index is None:
+            self._ra_index = {ra: index for index, ra in enumerate(self.ras) if ra is not None}
+        return self._ra_index
+
+    def times_data(self):
+        return TimesDataView(self)
+
+    def team_players(self, team_name):
+        """Dicionário de um time no formato de times_data, na ordem do ranking."""
+        team = self.team_index[team_name]
+        return {
+            self.player_ids[index]: {
+                "name": self.ras[index] if self.ras[index] is not None else self.player_ids[index],
+                "hours": self.hours[index],
+                "team": team_name,
+                "last_train_date": self.last_train[index],
+            }
+            for index in self.team_rankings[team]
+        }
+
+    def record(self, index):
+        last_train = self.last_train[index]
+        return {
+            "discord_id": self.player_ids[index],
+            "ra": self.ras[index],
+            "team": self.team_names[self.teams[index]],
+            "hours": round(self.hours[index], 4),
+            "last_train_date": (
+                datetime.fromtimestamp(last_train / 1000, tz=timezone.utc).isoformat() if last_train else None
+            ),
+            "team_rank": self.team_rank[index],
+            "overall_rank": self.overall_rank[index],
+        }
+
+    def find_player(self, player_id):
+        """Busca por Discord ID e, se não achar, por RA."""
+        index = self.player_index.get(player_id)
+        if index is None:
+            index = self.ra_index.get(player_id)
+        return None if index is None else self.record(index)
+
+    def team_ranking(self, team_name, offset=0, limit=None):
+        team = self.team_index.get(team_name)
+        if team is None:
+            return None
+        ranking = self.team_rankings[team]
+        end = len(ranking) if limit is None else offset + limit
+        return {
+            "team": team_name,
+            "players": len(ranking),
+            "total_hours": round(sum(self.hours[index] for index in ranking), 4),
+            "ranking": [self.record(index) for index in ranking[offset:end]],
+        }
+
+    def top(self, limit, team_name=None):
+        if team_name is not None:
+            ranking = self.team_ranking(team_name, 0, limit)
+            return None if ranking is None else ranking["ranking"]
+        return [self.record(index) for index in self.leaderboard[:limit]]
+
+    def stats(self):
+        arrays = (self.teams, self.hours, self.last_train, self.team_rank, self.leaderboard, self.overall_rank)
+        return {
+            "players": len(self.player_ids),
+            "teams": len(self.team_names),
+            "array_bytes": sum(a.itemsize * len(a) for a in arrays)
+            + sum(r.itemsize * len(r) for r in self.team_rankings.values()),
+        }
+
+
+class TimesDataView(Mapping):
+    """
+    times_data somente leitura apoiado no CompactModel: cada time é materializado
+    como dicionário só quando acessado (um por relatório), em vez de o snapshot
+    manter um dicionário por jogador o tempo todo.
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def __getitem__(self, team_name):
+        if team_name not in self.model.team_index:
+            raise KeyError(team_name)
+        return self.model.team_players(team_name)
+
+    def __contains__(self, team_name):
+        return team_name in self.model.team_index
+
+    def __iter__(self):
+        return iter(self.model.team_names)
+
+    def __len__(self):
+        return len(self.model.team_names)
@@ -4,4 +4,65 @@ class Config:
     def __init__(self):
         self.API_BASE_URL = os.getenv('API_BASE_URL', 'https://api-esports.lcstuber.net')
         self.API_TOKEN = os.getenv('API_TOKEN', 'frontendmauaesports')
-        self.DEBUG = os.getenv('DEBUG', 'True') == 'True'
\ No newline at end of file
+        self.DEBUG = os.getenv('DEBUG', 'True') == 'True'
+        # Tempo (s) que os dados buscados/processados ficam em cache; 0 desativa
+        self.SNAPSHOT_TTL = int(os.getenv('SNAPSHOT_TTL', '300'))
+        # Intervalo (s) do refresh do snapshot em segundo plano; 0 desativa
+        self.REFRESH_INTERVAL = int(os.getenv('REFRESH_INTERVAL', '0'))
+        # Idade máxima (s) de um snapshot expirado servido enquanto o refresh roda
+        self.REFRESH_MAX_STALENESS = int(os.getenv('REFRESH_MAX_STALENESS', '3600'))
+        # Arquivo (de preferência em /dev/shm) com o snapshot publicado para todos os workers,
+        # lido via mmap; vazio mantém o snapshot só no processo
+        self.SHARED_SNAPSHOT_PATH = os.getenv('SHARED_SNAPSHOT_PATH', '')
+        # Ingestão incremental de treinos (apenas novos ou alterados desde o watermark)
+        self.INCREMENTAL_INGESTION = os.getenv('INCREMENTAL_INGESTION', 'False') == 'True'
+        # Janela (s) antes do watermark em que treinos ainda podem ser editados na API;
+        # também limita as presenças guardadas pelos rollups para refazer treinos alterados
+        self.INCREMENTAL_REVISION_WINDOW = int(os.getenv('INCREMENTAL_REVISION_WINDOW', str(2 * 24 * 60 * 60)))
+        # Nome do parâmetro de filtro por data em /trains/all, se a API suportar
+        self.TRAINS_SINCE_PARAM = os.getenv('TRAINS_SINCE_PARAM', '')
+        # Dump local de /trains/all usado na carga inicial do modo incremental
+        self.TRAINS_BACKFILL_PATH = os.getenv('TRAINS_BACKFILL_PATH', '')
+        # Agregação dos treinos: 'python' (loop) ou 'vectorized' (pandas/NumPy)
+        self.AGGREGATION_ENGINE = os.getenv('AGGREGATION_ENGINE', 'python')
+        # Rollups diários/mensais de horas, montados no primeiro relatório de outro semestre ou período
+        self.ROLLUPS = os.getenv('ROLLUPS', 'True') == 'True'
+        # Arquivo SQLite onde treinos e presenças buscados são persistidos; vazio desativa
+        self.ATTENDANCE_DB_PATH = os.getenv('ATTENDANCE_DB_PATH', '')
+        # Cliente HTTP da API: pool de conexões, paralelismo, retries e timeout (s)
+        self.UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '10'))
+        self.UPSTREAM_MAX_WORKERS = int(os.getenv('UPSTREAM_MAX_WORKERS', '4'))
+        self.UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '3'))
+        self.UPSTREAM_BACKOFF = float(os.getenv('UPSTREAM_BACKOFF', '0.5'))
+        self.UPSTREAM_TIMEOUT = int(os.getenv('UPSTREAM_TIMEOUT', '60'))
+        # Quantidade máxima de Discord IDs por chamada a /usuarios/por-discord-ids
+        self.USER_IDS_CHUNK_SIZE = int(os.getenv('USER_IDS_CHUNK_SIZE', '100'))
+        # Decodifica /trains/all elemento a elemento em vez de carregar a lista inteira
+        self.STREAM_TRAINS = os.getenv('STREAM_TRAINS', 'False') == 'True'
+        # Tamanho máximo (bytes) do cache de PDFs/XLSX já renderizados
+        self.REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+        # Jobs assíncronos de relatório: threads, limite da fila, validade (s) do resultado e
+        # tamanho máximo (bytes) dos resultados guardados, acima do qual os mais antigos saem antes
+        self.REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+        self.REPORT_JOB_MAX_PENDING = int(os.getenv('REPORT_JOB_MAX_PENDING', '20'))
+        self.REPORT_JOB_TTL = int(os.getenv('REPORT_JOB_TTL', '600'))
+        self.REPORT_JOB_MAX_BYTES = int(os.getenv('REPORT_JOB_MAX_BYTES', str(100 * 1024 * 1024)))
+        # Processos usados na exportação em ZIP por time, em cada worker do servidor;
+        # 0 divide os núcleos entre os WEB_CONCURRENCY workers (definido pelo gunicorn.conf.py)
+        self.BUNDLE_WORKERS = int(os.getenv('BUNDLE_WORKERS', '0'))
+        self.WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+        # Renderização do PDF: 'fast' (fonte em cache, linhas em lote) ou 'legacy'
+        self.PDF_RENDERER = os.getenv('PDF_RENDERER', 'fast')
+        # Diretório do subconjunto da fonte usado pelo renderizador 'fast', compartilhado entre
+        # os processos (vazio usa horas-pae-<uid> no diretório temporário, só do usuário)
+        self.FONT_CACHE_DIR = os.getenv('FONT_CACHE_DIR', '')
+        # Geração do Excel: 'streaming' (openpyxl write-only) ou 'legacy' (pandas)
+        self.EXCEL_WRITER = os.getenv('EXCEL_WRITER', 'streaming')
+        # Cache Discord ID -> RA: validade (s) de usuários encontrados e de IDs desconhecidos,
+        # limite de entradas e arquivo JSON para warm start (vazio mantém só em memória)
+        self.USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', str(7 * 24 * 60 * 60)))
+        self.USER_CACHE_NEGATIVE_TTL = int(os.getenv('USER_CACHE_NEGATIVE_TTL', str(60 * 60)))
+        self.USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '50000'))
+        self.USER_CACHE_PATH = os.getenv('USER_CACHE_PATH', '')
+        # Exemplos guardados por categoria de anomalia (treinos/presenças inválidos) em /api/diagnostics
+        self.DIAGNOSTICS_SAMPLES = int(os.getenv('DIAGNOSTICS_SAMPLES', '3'))
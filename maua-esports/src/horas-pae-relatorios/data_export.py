@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ("discord_id", "ra", "team", "hours", "last_train_date")
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Linhas acumuladas antes de cada yield do CSV/NDJSON
+CHUNK_ROWS = 500
+
+
+def export_teams(times_data, teams=None):
+    """Times pedidos que existem em times_data; sem filtro, todos os times."""
+    if not teams:
+        return list(times_data)
+    teams = teams if isinstance(teams, list) else [teams]
+    return [team for team in teams if team in times_data]
+
+
+def iso_timestamp(timestamp_ms):
+    if not timestamp_ms:
+        return None
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).isoformat()
+
+
+def export_rows(times_data, teams):
+    """
+    Uma tupla por jogador na ordem de EXPORT_COLUMNS, time a time, ordenada por horas.
+    O RA fica vazio quando o jogador não foi encontrado na API de usuários
+    (nesse caso o "name" de times_data é o próprio Discord ID).
+    """
+    for team_name in teams:
+        team_data = times_data.get(team_name, {})
+        for discord_id, player in sorted(team_data.items(), key=lambda item: item[1]["hours"], reverse=True):
+            ra = player["name"] if player["name"] != discord_id else None
+            yield (discord_id, ra, team_name, player["hours"], player.get("last_train_date") or None)
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, (discord_id, ra, team, hours, last_train_date) in enumerate(rows, 1):
+        writer.writerow((discord_id, ra or "", team, round(hours, 4), iso_timestamp(last_train_date) or ""))
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    lines = []
+    for discord_id, ra, team, hours, last_train_date in rows:
+        lines.append(json.dumps({
+            "discord_id": discord_id,
+            "ra": ra,
+            "team": team,
+            "hours": round(hours, 4),
+            "last_train_date": iso_timestamp(last_train_date),
+        }, ensure_ascii=False))
+        if len(lines) == CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def write_parquet(rows, output):
+    """
+    Grava as linhas em Parquet, coluna a coluna. O pyarrow só é importado aqui para
+    não pesar na inicialização de quem nunca pede esse formato.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Exportação em Parquet requer o pacote pyarrow") from e
+
+    columns = {name: [] for name in EXPORT_COLUMNS}
+    for row in rows:
+        for name, value in zip(EXPORT_COLUMNS, row):
+            columns[name].append(value)
+
+    schema = pa.schema([
+        ("discord_id", pa.string()),
+        ("ra", pa.string()),
+        ("team", pa.dictionary(pa.int32(), pa.string())),
+        ("hours", pa.float64()),
+        ("last_train_date", pa.timestamp("ms", tz="UTC")),
+    ])
+    table = pa.Table.from_pydict(columns, schema=schema)
+    pq.write_table(table, output, compression="snappy")
+    logger.info("Wrote %s rows to Parquet", table.num_rows)
@@ -0,0 +1,80 @@
+import threading
+import time
+import logging
+from config import Config
+from metrics import anomalies_total
+
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo da representação de cada exemplo guardado
+SAMPLE_CHARS = 300
+
+
+class AnomalyCounter:
+    """
+    Anomalias de uma execução (um processamento de treinos), contadas por categoria.
+    Só os primeiros `max_samples` registros de cada categoria são formatados e
+    guardados como exemplo; os demais custam apenas um incremento.
+    """
+    def __init__(self, max_samples=None):
+        self.max_samples = Config().DIAGNOSTICS_SAMPLES if max_samples is None else max_samples
+        self.counts = {}
+        self.samples = {}
+
+    def record(self, category, example=None):
+        count = self.counts.get(category, 0)
+        self.counts[category] = count + 1
+        if count < self.max_samples:
+            sample = repr(example)
+            if len(sample) > SAMPLE_CHARS:
+                sample = sample[:SAMPLE_CHARS] + "..."
+            self.samples.setdefault(category, []).append(sample)
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+class Diagnostics:
+    """
+    Resumo das anomalias do processo: a última execução de cada origem (process_data,
+    incremental, rollups, period) com exemplos e os totais acumulados por categoria.
+    Cada execução gera uma única linha de log, em vez de uma por registro.
+    """
+    def __init__(self):
+        self.runs = {}
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def finish(self, source, anomalies):
+        total = anomalies.total()
+        with self._lock:
+            self.runs[source] = {
+                "finished_at": time.time(),
+                "total": total,
+                "counts": dict(anomalies.counts),
+                "samples": {category: list(samples) for category, samples in anomalies.samples.items()},
+            }
+            for category, count in anomalies.counts.items():
+                self.totals[category] = self.totals.get(category, 0) + count
+        for category, count in anomalies.counts.items():
+            anomalies_total.inc(count, source=source, category=category)
+        if total:
+            logger.warning(
+                "%s: ignored %d anomalous records (%s); see /api/diagnostics for examples",
+                source, total, ", ".join(f"{category}={count}" for category, count in sorted(anomalies.counts.items()))
+            )
+
+    def summary(self):
+        with self._lock:
+            return {
+                "totals": dict(self.totals),
+                "runs": {source: dict(run) for source, run in self.runs.items()},
+            }
+
+    def clear(self):
+        with self._lock:
+            self.runs.clear()
+            self.totals.clear()
+
+
+diagnostics = Diagnostics()
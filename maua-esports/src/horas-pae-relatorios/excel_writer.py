@@ -0,0 +1,48 @@
+import logging
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+logger = logging.getLogger(__name__)
+
+# Mesmo estilo de cabeçalho que o pandas aplica em DataFrame.to_excel
+_THIN = Side(style="thin")
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+
+def _header_row(worksheet):
+    row = []
+    for title in ("Jogador", "Horas"):
+        cell = WriteOnlyCell(worksheet, value=title)
+        cell.font = HEADER_FONT
+        cell.border = HEADER_BORDER
+        cell.alignment = HEADER_ALIGNMENT
+        row.append(cell)
+    return row
+
+
+def write_excel(times_data, teams, output, clean):
+    """
+    Escreve o XLSX direto a partir de times_data, uma aba por time, usando o modo
+    write-only do openpyxl: as linhas vão para arquivos temporários à medida que
+    são geradas, sem DataFrames intermediários. `output` é qualquer arquivo binário.
+    """
+    workbook = Workbook(write_only=True)
+    for team_name in teams:
+        team_data = times_data.get(team_name, {})
+        if not team_data:
+            logger.warning("No data for team '%s'", team_name)
+            continue
+
+        worksheet = workbook.create_sheet(clean(team_name, for_excel=True)[:31])
+        worksheet.column_dimensions['A'].width = 30
+        worksheet.column_dimensions['B'].width = 15
+        worksheet.append(_header_row(worksheet))
+        for player in sorted(team_data.values(), key=lambda x: x["hours"], reverse=True):
+            worksheet.append([player["name"], round(player["hours"], 1)])
+
+    if not workbook.worksheets:
+        raise ValueError("Nenhum dado disponível para gerar o Excel")
+    workbook.save(output)
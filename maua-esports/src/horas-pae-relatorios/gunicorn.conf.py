@@ -0,0 +1,39 @@
+"""
+Configuração do gunicorn para produção:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Cada worker importa a app depois do fork (preload_app desligado), e como
+pandas/fpdf/openpyxl só são importados quando um relatório é gerado, a subida de
+cada worker já é rápida. O refresher é uma thread, que não sobreviveria ao fork:
+cada worker o inicia em post_worker_init, depois de carregar a app.
+Com mais de um worker, o snapshot de dados é publicado em SHARED_SNAPSHOT_PATH e
+lido via mmap por todos, em vez de cada um buscar e manter a sua cópia.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# Threads por worker: as rotas passam boa parte do tempo esperando a API de esports
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+# Relatórios de todas as modalidades com a API lenta podem passar de um minuto
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+preload_app = False
+accesslog = "-"
+
+# /dev/shm evita I/O em disco no heartbeat dos workers e no arquivo do snapshot
+_shm = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+worker_tmp_dir = _shm
+if workers > 1:
+    os.environ.setdefault("SHARED_SNAPSHOT_PATH", os.path.join(_shm, "horas-pae-snapshot.bin"))
+# Cada worker tem o seu pool de bundles; os núcleos são divididos entre eles
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+
+def post_worker_init(worker):
+    from app import start_refresher
+    start_refresher()
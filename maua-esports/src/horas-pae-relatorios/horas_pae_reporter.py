@@ -1,17 +1,33 @@
 import io
+import re
+import time
+import sqlite3
+import tempfile
 import requests
-import pandas as pd
-from fpdf import FPDF
 from datetime import datetime
 from config import Config
+from snapshot_cache import ReportSnapshot, snapshot_cache
+from user_cache import user_cache
+from refresher import refresher
+from singleflight import data_fetches
+from rollups import get_rollup_index, current_rollup_index, reset_rollup_index, day_bounds
+from train_aggregator import TrainAggregator, get_incremental_aggregator
+from attendance_store import get_attendance_store
+from upstream_client import get_upstream_client
+from report_cache import times_data_version
+from compact_model import CompactModel
+from shared_snapshot import shared_snapshots
+from metrics import stage, trains_processed, attendances_processed
+from diagnostics import diagnostics
 import logging
-from flask import Flask, request, Response, jsonify
-from flask_cors import CORS
+
+# pandas, fpdf e openpyxl são importados só nos métodos que os usam, para que os
+# workers subam rápido e rotas que não geram relatórios não os carreguem
 
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)  # Suporte a CORS
+# Equivale a manter apenas caracteres com ord < 256 ou char.isspace()
+_UNSUPPORTED_CHARS = re.compile(r"[^\x00-\xff\s]")
 
 def clean_text(text, for_excel=False):
     """
@@ -22,7 +38,7 @@ def clean_text(text, for_excel=False):
     if not text:
         return text
     
-    cleaned = ''.join(char for char in text if ord(char) < 256 or char.isspace())
+    cleaned = _UNSUPPORTED_CHARS.sub('', text)
     
     if for_excel:
         invalid_chars = [':', '*', '?', '/', '\\', '[', ']']
@@ -40,7 +56,7 @@ def extract_ra_from_email(email):
     try:
         return email.split("@")[0]
     except IndexError:
-        logger.warning(f"Formato de email inválido: {email}")
+        logger.warning("Formato de email inválido: %s", email)
         return None
 
 class HorasPaeReporter:
@@ -48,9 +64,14 @@ class HorasPaeReporter:
         self.config = Config()
         self.modalidades = {}
         self.times_data = {}
+        self.model = None
+        self.data_version = None
+        self.data_updated_at = None
         self.semestre_atual = self.get_current_semester()
         self.api_token = self.config.API_TOKEN
         self.api_base_url = self.config.API_BASE_URL
+        self.client = get_upstream_client(self.config)
+        self.store = get_attendance_store(self.config.ATTENDANCE_DB_PATH) if self.config.ATTENDANCE_DB_PATH else None
 
     def get_current_semester(self):
         now = datetime.now()
@@ -67,242 +88,433 @@ class HorasPaeReporter:
             end_date = datetime(year, 12, 31, 23, 59, 59)
         return int(start_date.timestamp() * 1000), int(end_date.timestamp() * 1000)
 
-    def fetch_data(self):
-        try:
-            logger.info("Fetching modalities data...")
-            mod_response = requests.get(
-                f"{self.api_base_url}/modality/all",
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                timeout=60
-            )
-            mod_response.raise_for_status()
-            mod_data = mod_response.json()
-            logger.info(f"Raw modality data: {mod_data}")
-
-            # Handle dictionary or list response
-            if isinstance(mod_data, dict):
-                # Dictionary of modalities (e.g., {"6360944b04a823de3a359357": {"_id": ..., "Name": ...}})
-                self.modalidades = mod_data
-                # Validate that each modality has required fields
-                for mod_id, mod in self.modalidades.items():
-                    if not isinstance(mod, dict) or "_id" not in mod or "Name" not in mod:
-                        logger.warning(f"Invalid modality data for ID {mod_id}: {mod}")
-                        raise ValueError(f"Invalid modality data for ID {mod_id}")
-            elif isinstance(mod_data, list):
-                if mod_data and isinstance(mod_data[0], str):
-                    # List of team names (e.g., ["Valorant Feminino", "ValorantMisBlue"])
-                    self.modalidades = {name: {"Name": name} for name in mod_data}
-                elif mod_data and isinstance(mod_data[0], dict):
-                    # List of dictionaries (e.g., [{"_id": "mod123", "Name": "Valorant Feminino"}])
-                    self.modalidades = {str(mod["_id"]): mod for mod in mod_data}
-                else:
-                    logger.warning("Unexpected modality data format or empty list")
-                    self.modalidades = {}
-            else:
-                logger.error(f"Expected dict or list from /modality/all, got: {type(mod_data)}")
-                raise ValueError("Invalid modality data format")
+    def fetch_data(self, use_cache=True):
+        """
+        Busca modalidades e treinos e processa o semestre atual.
+        Com use_cache=True reaproveita o snapshot do processo enquanto o TTL não expirar.
+        Com o refresher ativo, um snapshot expirado (até REFRESH_MAX_STALENESS) é servido
+        e o refresh é antecipado, em vez de a requisição esperar pela API.
+        Buscas simultâneas do mesmo semestre são feitas uma vez só e compartilhadas;
+        com SHARED_SNAPSHOT_PATH, também entre os workers do servidor. Com
+        ATTENDANCE_DB_PATH, um processo sem snapshot parte dos dados do SQLite local,
+        tratados com a idade da última gravação.
+        """
+        cache_key = self.get_current_semester_bounds()
+        if use_cache:
+            shared_snapshots.sync(cache_key)
+            if self.store and snapshot_cache.peek(cache_key) is None:
+                data_fetches.do(("attendance_store",) + cache_key, lambda: self.load_store_snapshot(cache_key))
+            snapshot = snapshot_cache.get(cache_key)
+            if snapshot is None and refresher.running:
+                snapshot = snapshot_cache.get_stale(cache_key, refresher.max_staleness)
+                if snapshot is not None:
+                    refresher.trigger()
+                    logger.info("Serving stale snapshot (%.0fs old) while refreshing", snapshot.age())
+            if snapshot is not None:
+                logger.info("Using cached snapshot (%.0fs old)", snapshot.age())
+                self.load_snapshot(snapshot)
+                return
 
-            logger.info(f"Processed {len(self.modalidades)} modalities: {list(self.modalidades.keys())}")
+        snapshot, shared = data_fetches.do(cache_key, lambda: self.build_snapshot(cache_key, reuse_shared=use_cache))
+        if shared:
+            logger.info("Joined an in-flight data fetch")
+            self.load_snapshot(snapshot)
 
-            logger.info("Fetching trains data...")
-            trains_response = requests.get(
-                f"{self.api_base_url}/trains/all",
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                timeout=10
-            )
-            trains_response.raise_for_status()
-            trains_data = trains_response.json()
-            logger.info(f"Received {len(trains_data)} trains")
+    def load_modalities(self):
+        """
+        Carrega só as modalidades, para load_period sem processar o semestre atual:
+        do snapshot do processo ou de outro worker, mesmo expirado, dos rollups ainda
+        dentro de SNAPSHOT_TTL ou, sem nenhum deles, de /modality/all.
+        """
+        cache_key = self.get_current_semester_bounds()
+        shared_snapshots.sync(cache_key)
+        snapshot = snapshot_cache.peek(cache_key)
+        if snapshot is not None:
+            self.modalidades = snapshot.modalidades
+            return
+        index = current_rollup_index() if self.config.ROLLUPS else None
+        if index is not None and index.synced_at is not None and time.time() - index.synced_at < self.config.SNAPSHOT_TTL:
+            self.modalidades = index.modalidades
+            return
+        logger.info("Fetching modalities data...")
+        with stage("upstream_fetch"):
+            mod_data, _ = data_fetches.do(("modalities",), lambda: self.client.get_json("/modality/all"))
+        self.parse_modalities(mod_data)
 
-            self.process_data(trains_data)
+    def build_snapshot(self, cache_key, reuse_shared=False):
+        """
+        Busca e processa os dados do intervalo `cache_key`, grava o snapshot resultante
+        e o publica para os outros workers. Só um worker busca por vez; com reuse_shared,
+        quem esperou o lock adota o snapshot que outro acabou de publicar.
+        """
+        with shared_snapshots.build_lock():
+            if reuse_shared:
+                snapshot = shared_snapshots.sync(cache_key)
+                if snapshot is not None and snapshot.age() < snapshot_cache.ttl:
+                    logger.info("Using snapshot published by another worker")
+                    self.load_snapshot(snapshot)
+                    return snapshot
+            snapshot = self.fetch_snapshot(cache_key)
+            shared_snapshots.publish(cache_key, snapshot)
+            return snapshot
+
+    def fetch_snapshot(self, cache_key):
+        """Busca e processa os dados do intervalo `cache_key` e grava o snapshot no cache do processo."""
+        try:
+            if self.config.INCREMENTAL_INGESTION or self.config.STREAM_TRAINS:
+                # Os agregadores precisam das modalidades antes dos treinos, então as buscas são sequenciais
+                logger.info("Fetching modalities data...")
+                with stage("upstream_fetch"):
+                    mod_data = self.client.get_json("/modality/all")
+                self.parse_modalities(mod_data)
+                if self.config.INCREMENTAL_INGESTION:
+                    self.ingest_incremental(*cache_key)
+                else:
+                    self.process_train_stream(self.persisted(self.fetch_trains(), complete=True), *cache_key)
+            else:
+                logger.info("Fetching modalities and trains data...")
+                with stage("upstream_fetch"):
+                    mod_data, trains_data = self.client.fetch_modalities_and_trains()
+                self.parse_modalities(mod_data)
+                if not isinstance(trains_data, list):
+                    raise ValueError("Expected list of trains data")
+                logger.info("Received %s trains", len(trains_data))
+                self.process_data(trains_data)
+                if self.store:
+                    self.store.save_trains(trains_data)
+                    self.store.delete_missing_trains(
+                        train["_id"] for train in trains_data if isinstance(train, dict) and train.get("_id") is not None
+                    )
+            if self.store:
+                self.store.save_modalities(self.modalidades)
+            snapshot = ReportSnapshot(self.modalidades, self.model, self.data_version, self.data_updated_at)
+            snapshot_cache.put(cache_key, snapshot)
+            return snapshot
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"API request failed: {str(e)}")
+            logger.error("API request failed: %s", e)
             raise Exception(f"Erro na API: {str(e)}")
         except Exception as e:
-            logger.error(f"Error processing data: {str(e)}")
+            logger.error("Error processing data: %s", e)
             raise
 
+    def parse_modalities(self, mod_data):
+        logger.debug("Raw modality data: %s", mod_data)
+
+        # Handle dictionary or list response
+        if isinstance(mod_data, dict):
+            # Dictionary of modalities (e.g., {"6360944b04a823de3a359357": {"_id": ..., "Name": ...}})
+            self.modalidades = mod_data
+            # Validate that each modality has required fields
+            for mod_id, mod in self.modalidades.items():
+                if not isinstance(mod, dict) or "_id" not in mod or "Name" not in mod:
+                    logger.warning("Invalid modality data for ID %s: %s", mod_id, mod)
+                    raise ValueError(f"Invalid modality data for ID {mod_id}")
+        elif isinstance(mod_data, list):
+            if mod_data and isinstance(mod_data[0], str):
+                # List of team names (e.g., ["Valorant Feminino", "ValorantMisBlue"])
+                self.modalidades = {name: {"Name": name} for name in mod_data}
+            elif mod_data and isinstance(mod_data[0], dict):
+                # List of dictionaries (e.g., [{"_id": "mod123", "Name": "Valorant Feminino"}])
+                self.modalidades = {str(mod["_id"]): mod for mod in mod_data}
+            else:
+                logger.warning("Unexpected modality data format or empty list")
+                self.modalidades = {}
+        else:
+            logger.error("Expected dict or list from /modality/all, got: %s", type(mod_data))
+            raise ValueError("Invalid modality data format")
+
+        logger.info("Processed %d modalities", len(self.modalidades))
+
+    def fetch_trains(self, since=None):
+        """
+        Busca os treinos em /trains/all. Se TRAINS_SINCE_PARAM estiver configurado,
+        envia `since` como filtro de StartTimestamp para a API. Com STREAM_TRAINS
+        retorna um iterador que decodifica os treinos à medida que chegam.
+        """
+        params = {}
+        if since is not None and self.config.TRAINS_SINCE_PARAM:
+            params[self.config.TRAINS_SINCE_PARAM] = since
+        if self.config.STREAM_TRAINS:
+            logger.info("Streaming trains data...")
+            return self.client.stream_json_array("/trains/all", params=params)
+        logger.info("Fetching trains data...")
+        with stage("upstream_fetch"):
+            trains_data = self.client.get_json("/trains/all", params=params)
+        if not isinstance(trains_data, list):
+            raise ValueError("Expected list of trains data")
+        logger.info("Received %s trains", len(trains_data))
+        return trains_data
+
+    def ingest_incremental(self, start_date, end_date):
+        """
+        Incorpora apenas treinos novos ou alterados no agregador incremental do processo
+        e reconstrói times_data a partir dos agregados.
+        """
+        aggregator = get_incremental_aggregator(
+            self.modalidades, start_date, end_date,
+            self.config.INCREMENTAL_REVISION_WINDOW * 1000
+        )
+        with aggregator.lock:
+            if aggregator.watermark == 0 and self.config.TRAINS_BACKFILL_PATH:
+                aggregator.backfill(self.config.TRAINS_BACKFILL_PATH)
+            trains_data = self.fetch_trains(since=aggregator.since())
+            train_count, attendance_count = aggregator.train_count, aggregator.attendance_count
+            with stage("process_data"):
+                # Sem filtro de data na API a resposta é completa, e treinos apagados saem dos agregados
+                complete = not self.config.TRAINS_SINCE_PARAM
+                aggregator.ingest(self.persisted(trains_data, complete=complete), complete=complete)
+            trains_processed.inc(max(aggregator.train_count - train_count, 0), engine="incremental")
+            attendances_processed.inc(max(aggregator.attendance_count - attendance_count, 0), engine="incremental")
+            self.build_times_data(aggregator, "incremental")
+
+    def persisted(self, trains, complete=False, batch_size=1000):
+        """
+        Repassa os treinos de um iterável gravando-os no SQLite local em lotes,
+        quando ATTENDANCE_DB_PATH está configurado. Com complete=True o iterável é a
+        lista inteira da API: ao final, treinos que não vieram mais saem do SQLite.
+        """
+        if not self.store:
+            yield from trains
+            return
+        batch = []
+        train_ids = set() if complete else None
+        for train in trains:
+            batch.append(train)
+            if train_ids is not None and isinstance(train, dict) and train.get("_id") is not None:
+                train_ids.add(str(train["_id"]))
+            yield train
+            if len(batch) >= batch_size:
+                self.store.save_trains(batch)
+                batch = []
+        if batch:
+            self.store.save_trains(batch)
+        if train_ids is not None:
+            self.store.delete_missing_trains(train_ids)
+
+    def load_period(self, start_day, end_day, label):
+        """
+        Substitui times_data pelas horas de [start_day, end_day] (datas, inclusive),
+        combinando os rollups em vez de reprocessar os treinos. Deve ser chamado
+        depois de fetch_data ou load_modalities. Os rollups ficam fora do fetch do
+        semestre atual e são montados no primeiro período pedido, e de novo quando
+        passam de SNAPSHOT_TTL; sincronizações simultâneas são feitas uma vez só.
+        Com ATTENDANCE_DB_PATH, que fetch_data mantém atualizado, o período é lido
+        do SQLite local sem chamar a API. `label` passa a ser o semestre exibido nos relatórios.
+        """
+        logger.info("Loading period %s (%s to %s)", label, start_day, end_day)
+        if self.store:
+            with stage("attendance_store"):
+                self.load_from_store(*day_bounds(start_day, end_day))
+        elif self.config.ROLLUPS:
+            index = get_rollup_index(self.modalidades)
+            if index.synced_at is None or time.time() - index.synced_at >= self.config.SNAPSHOT_TTL:
+                logger.info("Rollups are missing or outdated in this process, syncing them")
+                with stage("rollups"):
+                    index, shared = data_fetches.do(("rollups",), self.sync_rollups)
+                if shared:
+                    logger.info("Joined an in-flight rollup sync")
+            with stage("rollups"):
+                aggregator = index.aggregate(start_day, end_day)
+            self.build_times_data(aggregator, "period")
+        else:
+            trains = self.fetch_trains()
+            self.process_train_stream(trains, *day_bounds(start_day, end_day))
+        self.semestre_atual = label
+
+    def sync_rollups(self):
+        """
+        Sincroniza os rollups do processo com a lista completa de /trains/all. Se
+        treinos anteriores à janela de revisão mudaram ou sumiram, o índice não
+        consegue desfazer as suas horas: ele é descartado e reconstruído do zero.
+        """
+        index = get_rollup_index(self.modalidades)
+        index.ingest(self.fetch_trains(), complete=True)
+        if index.frozen_changes:
+            logger.info("Rebuilding rollups after %s changes before the revision window", index.frozen_changes)
+            reset_rollup_index()
+            index = get_rollup_index(self.modalidades)
+            index.ingest(self.fetch_trains(), complete=True)
+        if self.config.TRAINS_BACKFILL_PATH and not index.backfilled:
+            index.backfill(self.config.TRAINS_BACKFILL_PATH)
+        return index
+
+    def load_from_store(self, start_date=None, end_date=None, modality_ids=None):
+        """
+        Processa um semestre ou intervalo de datas a partir do SQLite local
+        (ATTENDANCE_DB_PATH), sem chamar /modality/all nem /trains/all.
+        """
+        if not self.store:
+            raise ValueError("ATTENDANCE_DB_PATH não configurado")
+        if start_date is None or end_date is None:
+            start_date, end_date = self.get_current_semester_bounds()
+        self.modalidades = self.store.load_modalities()
+        trains_data = self.store.load_trains(start_date, end_date, modality_ids)
+        self.process_data(trains_data, start_date, end_date)
+
+    def load_store_snapshot(self, cache_key):
+        """
+        Monta o snapshot do intervalo `cache_key` a partir do SQLite local e o grava no
+        cache do processo com created_at da última gravação no arquivo, para que o TTL
+        e o refresher decidam se ele ainda serve ou se os dados são buscados na API.
+        Não lê nada quando a idade do arquivo já faria fetch_data ignorar o snapshot.
+        """
+        synced_at = self.store.synced_at()
+        if synced_at is None:
+            return None
+        age = time.time() - synced_at
+        if snapshot_cache.ttl <= 0 or (age >= snapshot_cache.ttl and not (refresher.running and age < refresher.max_staleness)):
+            # fetch_data não serviria esse snapshot (SNAPSHOT_TTL=0 ou dados velhos demais): vai direto à API
+            return None
+        logger.info("Loading snapshot from attendance store (%.0fs old)", age)
+        try:
+            with stage("attendance_store"):
+                self.load_from_store(*cache_key)
+        except sqlite3.Error as e:
+            logger.warning("Could not load snapshot from attendance store: %s", e)
+            return None
+        snapshot = ReportSnapshot(self.modalidades, self.model, self.data_version, synced_at)
+        snapshot_cache.put(cache_key, snapshot)
+        return snapshot
+
+    def load_snapshot(self, snapshot):
+        self.modalidades = snapshot.modalidades
+        self.model = snapshot.model
+        self.times_data = snapshot.model.times_data()
+        self.data_version = snapshot.version
+        self.data_updated_at = snapshot.created_at
+
     def fetch_user_data(self, discord_ids):
         """
-        Busca dados de usuários por Discord IDs e retorna um mapeamento de Discord ID para RA/email.
+        Retorna um mapeamento de Discord ID para RA/email. IDs já resolvidos vêm do
+        user_cache; só os novos ou expirados são buscados na API. Se a API falhar,
+        o cache ainda serve as entradas expiradas que tiver.
         """
         try:
             if not discord_ids:
                 logger.info("Nenhum Discord ID para buscar.")
                 return {}
-            discord_ids_param = ",".join(discord_ids)
-            logger.info(f"Fetching user data for {len(discord_ids)} Discord IDs")
-            response = requests.get(
-                f"{self.api_base_url}/usuarios/por-discord-ids?ids={discord_ids_param}",
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                timeout=10
-            )
-            response.raise_for_status()
-            users = response.json()
-            user_map = {}
-            for user in users:
-                if user.get("discordID"):
-                    ra = extract_ra_from_email(user.get("email"))
-                    user_map[user["discordID"]] = {
-                        "email": user.get("email"),
-                        "ra": ra if ra else user["discordID"],
-                    }
-            logger.info(f"Fetched user data for {len(user_map)} Discord IDs")
-            return user_map
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch user data: {str(e)}")
-            return {}
+            with stage("user_lookup"):
+                return user_cache.resolve(discord_ids, self.fetch_users_from_api)
         except Exception as e:
-            logger.error(f"Error processing user data: {str(e)}")
+            logger.error("Error processing user data: %s", e)
             return {}
 
-    def process_data(self, trains_data, start_date=None, end_date=None):
+    def fetch_users_from_api(self, discord_ids):
+        """Busca /usuarios/por-discord-ids; erros da API são propagados para o user_cache."""
+        logger.info("Fetching user data for %s Discord IDs", len(discord_ids))
+        try:
+            users = self.client.fetch_users(discord_ids)
+        except requests.exceptions.RequestException as e:
+            logger.error("Failed to fetch user data: %s", e)
+            raise
+        user_map = {}
+        for user in users:
+            if user.get("discordID"):
+                ra = extract_ra_from_email(user.get("email"))
+                user_map[user["discordID"]] = {
+                    "email": user.get("email"),
+                    "ra": ra if ra else user["discordID"],
+                }
+        logger.info("Fetched user data for %s Discord IDs", len(user_map))
+        return user_map
+
+    def process_data(self, trains_data, start_date=None, end_date=None, engine=None):
+        """
+        Calcula as horas por jogador e por time. `engine` escolhe entre o agregador
+        em Python ("python") e o vetorizado ("vectorized"); o padrão vem de AGGREGATION_ENGINE.
+        """
         if not isinstance(trains_data, list):
             raise ValueError("Expected list of trains data")
-        
+        self.process_train_stream(trains_data, start_date, end_date, engine)
+
+    def process_train_stream(self, trains, start_date=None, end_date=None, engine=None):
+        """
+        Agrega, em uma única passada, treinos vindos de qualquer iterável. Treinos fora
+        do semestre ou não ENDED são descartados na hora; com o engine "python" a memória
+        depende só do número de jogadores, não do histórico de treinos.
+        """
         if start_date is None or end_date is None:
             start_date, end_date = self.get_current_semester_bounds()
-    
-        player_hours = {}
-        train_count = 0
-        player_count = 0
-        current_semester_train_count = 0
-        discord_ids = set()
-
-        # Coleta todos os Discord IDs dos treinos válidos
-        for train in trains_data:
-            if not isinstance(train, dict):
-                logger.warning(f"Invalid train data: {train}")
-                continue
-            if train.get("Status") != "ENDED":
-                continue
-            train_timestamp = train.get("StartTimestamp")
-            if not train_timestamp or not (start_date <= train_timestamp <= end_date):
-                continue
-            attended_players = train.get("AttendedPlayers", [])
-            if not isinstance(attended_players, list):
-                logger.warning(f"Invalid AttendedPlayers in train: {train}")
-                continue
-            for player in attended_players:
-                if player.get("PlayerId"):
-                    discord_ids.add(str(player["PlayerId"]))
-        
-        # Busca dados de usuários para os Discord IDs coletados
-        user_map = self.fetch_user_data(discord_ids)
-        logger.info(f"User map contains {len(user_map)} entries")
-    
-        # Calcula horas por jogador e por time
-        for train in trains_data:
-            if not isinstance(train, dict):
-                logger.warning(f"Invalid train data: {train}")
-                continue
-            if train.get("Status") != "ENDED":
-                continue
-            train_timestamp = train.get("StartTimestamp")
-            if not train_timestamp or not (start_date <= train_timestamp <= end_date):
-                continue
-            modality_id = str(train.get("ModalityId"))
-            if not modality_id:
-                logger.warning(f"Train missing ModalityId: {train}")
-                continue
-            modality = self.modalidades.get(modality_id)
-            if not modality:
-                logger.warning(f"Modality not found for ModalityId: {modality_id}")
-                continue
-            attended_players = train.get("AttendedPlayers", [])
-            if not isinstance(attended_players, list):
-                logger.warning(f"Invalid AttendedPlayers in train: {train}")
-                continue
-            
-            train_count += 1
-            current_semester_train_count += 1
-        
-            for player in attended_players:
-                try:
-                    if not all(k in player for k in ["PlayerId", "EntranceTimestamp", "ExitTimestamp"]):
-                        logger.warning(f"Invalid player data: {player}")
-                        continue
-                    entrance_ts = player["EntranceTimestamp"]
-                    exit_ts = player["ExitTimestamp"]
-                    if not (start_date <= entrance_ts <= end_date) or not (start_date <= exit_ts <= end_date):
-                        continue
-                    player_id = str(player["PlayerId"])
-                    duration = (exit_ts - entrance_ts) / (1000 * 60 * 60)
-                
-                    user_data = user_map.get(player_id, {})
-                    display_name = user_data.get("ra", player_id)
-                
-                    if player_id not in player_hours:
-                        player_hours[player_id] = {
-                            "name": display_name,
-                            "total_hours": 0,
-                            "teams": {},
-                            "last_train_date": 0
-                        }
-                
-                    if modality_id not in player_hours[player_id]["teams"]:
-                        player_hours[player_id]["teams"][modality_id] = {
-                            "hours": 0,
-                            "team_name": modality["Name"]
-                        }
-                
-                    player_hours[player_id]["teams"][modality_id]["hours"] += duration
-                    player_hours[player_id]["total_hours"] += duration
-                    player_count += 1
-                    if train_timestamp > player_hours[player_id]["last_train_date"]:
-                        player_hours[player_id]["last_train_date"] = train_timestamp
-                    
-                except (TypeError, KeyError) as e:
-                    logger.warning(f"Error processing player data: {e}, player: {player}")
-                    continue
-                
-        logger.info(f"Processed {train_count} total trains (current semester: {current_semester_train_count})")
-        logger.info(f"Current semester players: {player_count} attendances")
-    
-        # Inicializa times_data com todos os times
-        self.times_data = {mod["Name"]: {} for mod in self.modalidades.values()}
-        logger.info(f"Initialized times_data with teams: {list(self.times_data.keys())}")
-    
-        # Atribui jogadores ao time principal (com mais horas)
-        for player_id, data in player_hours.items():
-            if not data["teams"]:
-                logger.warning(f"Player {player_id} has no team assignments")
-                continue
-            main_team_id = max(data["teams"], key=lambda k: data["teams"][k]["hours"], default=None)
-            if not main_team_id:
-                logger.warning(f"Player {player_id} has no valid main team")
-                continue
-            main_team_name = data["teams"][main_team_id]["team_name"]
-            if main_team_name in self.times_data:
-                self.times_data[main_team_name][player_id] = {
-                    "name": data["name"],
-                    "hours": data["total_hours"],
-                    "team": main_team_name,
-                    "last_train_date": data["last_train_date"]
-                }
-            else:
-                logger.warning(f"Main team {main_team_name} not found in times_data for player {player_id}")
-        
-        logger.info(f"Populated times_data: {{ {', '.join(f'{k}: {len(v)} players' for k, v in self.times_data.items())} }}")
+
+        engine = engine or self.config.AGGREGATION_ENGINE
+        if engine == "vectorized":
+            from vectorized_aggregator import VectorizedTrainAggregator
+            aggregator = VectorizedTrainAggregator(self.modalidades, start_date, end_date)
+        elif engine == "python":
+            aggregator = TrainAggregator(self.modalidades, start_date, end_date)
+        else:
+            raise ValueError(f"Unknown aggregation engine: {engine}")
+        with stage("process_data"):
+            for train in trains:
+                aggregator.add_train(train)
+        trains_processed.inc(aggregator.train_count, engine=engine)
+        attendances_processed.inc(aggregator.attendance_count, engine=engine)
+
+        logger.info("Processed %s trains in the current semester", aggregator.train_count)
+        logger.info("Current semester players: %s attendances", aggregator.attendance_count)
+        self.build_times_data(aggregator)
+
+    def build_times_data(self, aggregator, source="process_data"):
+        """
+        Resolve os RAs dos jogadores agregados e atribui cada um ao time principal (com mais horas).
+        As anomalias do agregador viram um único resumo em `diagnostics`, com `source` como origem.
+        """
+        user_map = self.fetch_user_data(aggregator.player_ids())
+        logger.info("User map contains %s entries", len(user_map))
+
+        times_data = aggregator.build_times_data(user_map)
+        diagnostics.finish(source, aggregator.take_anomalies())
+        self.data_version = times_data_version(times_data)
+        self.data_updated_at = time.time()
+        logger.info("Populated times_data: %d teams, %d players", len(times_data), sum(map(len, times_data.values())))
+        # O snapshot guarda só o modelo compacto; times_data passa a ser uma visão sobre ele
+        self.model = CompactModel.from_times_data(times_data, self.data_version)
+        self.times_data = self.model.times_data()
 
     def generate_pdf(self, teams):
+        if self.config.PDF_RENDERER == "legacy":
+            with stage("render_pdf"):
+                return self.generate_pdf_legacy(teams)
         try:
-            logger.info(f"Generating PDF for teams: {teams}")
+            logger.info("Generating PDF for teams: %s", teams)
+            teams = teams if isinstance(teams, list) else [teams]
+            teams_found = [team for team in teams if team in self.times_data]
+
+            logger.info("Teams found in times_data: %s", teams_found)
+            if not teams_found:
+                raise ValueError(f"Nenhum time válido encontrado: {teams}")
+
+            from pdf_renderer import render_pdf
+            with stage("render_pdf"):
+                return render_pdf(self.times_data, teams_found, self.semestre_atual, clean_text)
+
+        except Exception as e:
+            logger.error("PDF generation failed: %s", e)
+            raise
+
+    def generate_pdf_legacy(self, teams):
+        """
+        Implementação original, uma chamada de cell por célula; mantida para
+        comparação nos benchmarks e selecionável com PDF_RENDERER=legacy.
+        """
+        try:
+            from fpdf import FPDF
+            logger.info("Generating PDF for teams: %s", teams)
             pdf = FPDF()
             pdf.add_font("DejaVu", "", "./fonts/DejaVuSans.ttf", uni=True)
             pdf.set_font("DejaVu", "", 12)
             teams = teams if isinstance(teams, list) else [teams]
             teams_found = [team for team in teams if team in self.times_data]
             
-            logger.info(f"Teams found in times_data: {teams_found}")
+            logger.info("Teams found in times_data: %s", teams_found)
             if not teams_found:
                 raise ValueError(f"Nenhum time válido encontrado: {teams}")
 
             for team_index, team_name in enumerate(teams_found):
                 team_data = self.times_data.get(team_name, {})
                 if not team_data:
-                    logger.warning(f"No data for team '{team_name}'")
+                    logger.warning("No data for team '%s'", team_name)
                     continue
                 
                 if team_index > 0:
@@ -331,25 +543,69 @@ class HorasPaeReporter:
             return pdf.output(dest='S')
         
         except Exception as e:
-            logger.error(f"PDF generation failed: {str(e)}")
+            logger.error("PDF generation failed: %s", e)
             raise
 
     def generate_excel(self, teams):
+        if self.config.EXCEL_WRITER == "legacy":
+            with stage("render_excel"):
+                return self.generate_excel_legacy(teams)
+        with self.generate_excel_file(teams) as output:
+            return output.read()
+
+    def generate_excel_file(self, teams):
+        """
+        Gera o XLSX em um arquivo temporário (posicionado no início) que pode ser
+        enviado em partes na resposta, sem manter o documento inteiro em memória.
+        """
+        try:
+            logger.info("Generating Excel for teams: %s", teams)
+            teams = teams if isinstance(teams, list) else [teams]
+            teams_found = [team for team in teams if team in self.times_data]
+
+            logger.info("Teams found in times_data: %s", teams_found)
+            if not teams_found:
+                raise ValueError(f"Nenhum time válido encontrado: {teams}")
+
+            output = tempfile.TemporaryFile()
+            try:
+                with stage("render_excel"):
+                    if self.config.EXCEL_WRITER == "legacy":
+                        output.write(self.generate_excel_legacy(teams_found))
+                    else:
+                        from excel_writer import write_excel
+                        write_excel(self.times_data, teams_found, output, clean_text)
+            except Exception:
+                output.close()
+                raise
+            output.seek(0)
+            return output
+
+        except Exception as e:
+            logger.error("Excel generation failed: %s", e)
+            raise
+
+    def generate_excel_legacy(self, teams):
+        """
+        Implementação original com um DataFrame por time; mantida para
+        comparação nos benchmarks e selecionável com EXCEL_WRITER=legacy.
+        """
         try:
-            logger.info(f"Generating Excel for teams: {teams}")
+            logger.info("Generating Excel for teams: %s", teams)
             teams = teams if isinstance(teams, list) else [teams]
             teams_found = [team for team in teams if team in self.times_data]
             
-            logger.info(f"Teams found in times_data: {teams_found}")
+            logger.info("Teams found in times_data: %s", teams_found)
             if not teams_found:
                 raise ValueError(f"Nenhum time válido encontrado: {teams}")
 
+            import pandas as pd
             output = io.BytesIO()
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
                 for team_name in teams_found:
                     team_data = self.times_data.get(team_name, {})
                     if not team_data:
-                        logger.warning(f"No data for team '{team_name}'")
+                        logger.warning("No data for team '%s'", team_name)
                         continue
                     
                     df = pd.DataFrame(list(team_data.values()))
@@ -371,65 +627,5 @@ class HorasPaeReporter:
             return output.getvalue()
         
         except Exception as e:
-            logger.error(f"Excel generation failed: {str(e)}")
+            logger.error("Excel generation failed: %s", e)
             raise
-
-# Endpoints Flask
-reporter = HorasPaeReporter()
-
-@app.route('/api/generate-pdf-report', methods=['POST'])
-def generate_pdf_report():
-    try:
-        data = request.get_json()
-        logger.info(f"Received request data: {data}")
-        if not data:
-            logger.error("No JSON data provided in request")
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        teams = data.get('team')
-        if not teams:
-            logger.error("Missing team parameter in request")
-            return jsonify({"error": "Missing team parameter"}), 400
-        
-        reporter.fetch_data()
-        pdf_data = reporter.generate_pdf(teams)
-        
-        filename = f'relatorio_pae_{"todas_modalidades" if len(teams) > 1 else clean_text(teams[0])}_{reporter.semestre_atual}.pdf'
-        return Response(
-            pdf_data,
-            mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment;filename={filename}'}
-        )
-    except Exception as e:
-        logger.error(f"PDF endpoint error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/generate-excel-report', methods=['POST'])
-def generate_excel_report():
-    try:
-        data = request.get_json()
-        logger.info(f"Received request data: {data}")
-        if not data:
-            logger.error("No JSON data provided in request")
-            return jsonify({"error": "No JSON data provided"}), 400
-        
-        teams = data.get('team')
-        if not teams:
-            logger.error("Missing team parameter in request")
-            return jsonify({"error": "Missing team parameter"}), 400
-        
-        reporter.fetch_data()
-        excel_data = reporter.generate_excel(teams)
-        
-        filename = f'relatorio_pae_{"todas_modalidades" if len(teams) > 1 else clean_text(teams[0])}_{reporter.semestre_atual}.xlsx'
-        return Response(
-            excel_data,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment;filename={filename}'}
-        )
-    except Exception as e:
-        logger.error(f"Excel endpoint error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
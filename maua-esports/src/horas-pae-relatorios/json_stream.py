@@ -0,0 +1,78 @@
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+def iter_json_array(chunks):
+    """
+    Itera os elementos de um array JSON de topo recebido em pedaços (bytes ou str),
+    sem montar a lista inteira em memória. Cada elemento é decodificado com
+    json.JSONDecoder.raw_decode assim que chega por completo.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = utf8.decode(chunk)
+            if chunk:
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                return True
+        buffer = buffer[pos:] + utf8.decode(b"", final=True)
+        pos = 0
+        eof = True
+        return False
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or eof or not read_more():
+                return
+
+    skip(_WHITESPACE)
+    if pos >= len(buffer) or buffer[pos] != "[":
+        raise ValueError("Expected JSON array")
+    pos += 1
+
+    while True:
+        skip(_WHITESPACE)
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if started:
+            if buffer[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {pos}")
+            pos += 1
+            skip(_WHITESPACE)
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof or not read_more():
+                    raise
+                continue
+            # Um número cortado no fim do pedaço ("-1.5e") pode continuar no próximo
+            if not eof and not buffer[end:].lstrip(_NUMBER_CHARS):
+                read_more()
+                continue
+            break
+
+        pos = end
+        started = True
+        yield value
@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Limites (s) dos histogramas de latência; cobrem de uma leitura de cache a um fetch completo
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Limites (bytes) dos histogramas de tamanho de payload
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames + ("le",), key + (_format_value(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Métricas do processo no formato texto do Prometheus. Contadores e histogramas
+    são atualizados pelo código; `collector` registra funções chamadas a cada scrape
+    que devolvem gauges no formato [(nome, ajuda, [(labels, valor), ...]), ...].
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        self._collectors.append(collect)
+        return collect
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                gauges = collect()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", collect.__name__, e)
+                continue
+            for name, documentation, samples in gauges:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "horas_pae_stage_seconds", "Duração de cada etapa da geração de relatórios.", ("stage",)
+)
+http_request_seconds = registry.histogram(
+    "horas_pae_http_request_seconds", "Latência das rotas HTTP.", ("route", "method", "status")
+)
+upstream_request_seconds = registry.histogram(
+    "horas_pae_upstream_request_seconds", "Latência das chamadas à API de esports.", ("path", "outcome")
+)
+upstream_response_bytes = registry.histogram(
+    "horas_pae_upstream_response_bytes", "Tamanho das respostas da API de esports.", ("path",), SIZE_BUCKETS
+)
+report_bytes = registry.histogram(
+    "horas_pae_report_bytes", "Tamanho dos relatórios e exportações gerados.", ("format",), SIZE_BUCKETS
+)
+trains_processed = registry.counter(
+    "horas_pae_trains_processed_total", "Treinos do semestre incorporados pelos agregadores.", ("engine",)
+)
+attendances_processed = registry.counter(
+    "horas_pae_attendances_processed_total", "Presenças válidas incorporadas pelos agregadores.", ("engine",)
+)
+anomalies_total = registry.counter(
+    "horas_pae_anomalies_total", "Treinos e presenças ignorados por dados inválidos, por categoria.", ("source", "category")
+)
+
+# Etapas medidas durante a requisição atual, para o cabeçalho Server-Timing
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def start_request_timing():
+    _request_timings.set([])
+
+
+def request_timings():
+    return _request_timings.get() or []
+
+
+@contextmanager
+def stage(name):
+    """Mede um bloco: alimenta horas_pae_stage_seconds e o Server-Timing da requisição atual."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing_header(timings):
+    """Soma etapas repetidas (ex.: lotes de usuários) e formata em milissegundos."""
+    totals = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in totals.items())
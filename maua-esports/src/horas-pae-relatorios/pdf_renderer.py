@@ -0,0 +1,135 @@
+import os
+import tempfile
+import threading
+import logging
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from fontTools import subset as ftsubset, ttLib
+from config import Config
+from atomic_file import atomic_write, private_dir
+
+logger = logging.getLogger(__name__)
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")
+FONT_FAMILY = "DejaVu"
+
+NAME_WIDTH = 100
+HOURS_WIDTH = 40
+ROW_HEIGHT = 10
+TITLE_WIDTH = 200
+
+_subset_path = None
+_subset_lock = threading.Lock()
+
+
+def subset_font_path():
+    """
+    Subconjunto do DejaVuSans só com os caracteres que clean_text deixa passar
+    (Latin-1 e espaços). O add_font e o subsetting feito pelo fpdf na saída passam
+    a trabalhar sobre ~30 KB em vez da fonte inteira. O arquivo fica em FONT_CACHE_DIR,
+    um diretório só do usuário do processo, identificado pelo tamanho e mtime da fonte,
+    então é gerado uma vez e reaproveitado por todos os processos (workers e pool de bundles).
+    """
+    global _subset_path
+    with _subset_lock:
+        if _subset_path is None:
+            stat = os.stat(FONT_PATH)
+            name = f"dejavu-latin1-{stat.st_size:x}-{stat.st_mtime_ns:x}.ttf"
+            directory = Config().FONT_CACHE_DIR or os.path.join(tempfile.gettempdir(), f"horas-pae-{os.getuid()}")
+            try:
+                path = os.path.join(private_dir(directory), name)
+            except (OSError, ValueError) as e:
+                # Sem um diretório seguro para compartilhar, cada processo gera a sua cópia
+                logger.warning("Not sharing the PDF font subset: %s", e)
+                path = os.path.join(tempfile.mkdtemp(prefix="horas-pae-font-"), name)
+            if not os.path.exists(path):
+                _write_subset_font(path)
+            _subset_path = path
+        return _subset_path
+
+
+def _write_subset_font(path):
+    font = ttLib.TTFont(FONT_PATH, recalcTimestamp=False)
+    codepoints = [cp for cp in font.getBestCmap() if cp < 256 or chr(cp).isspace()]
+    options = ftsubset.Options(notdef_outline=True, recommended_glyphs=True)
+    options.drop_tables += ["FFTM", "GDEF", "GPOS", "GSUB", "MATH", "hdmx"]
+    subsetter = ftsubset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    with atomic_write(path, prefix=".dejavu-", suffix=".ttf") as output:
+        font.save(output)
+    logger.info("Subset PDF font to %s characters at %s", len(codepoints), path)
+
+
+def new_document():
+    pdf = FPDF()
+    pdf.add_font(FONT_FAMILY, "", subset_font_path())
+    pdf.set_font(FONT_FAMILY, "", 12)
+    return pdf
+
+
+def team_rows(team_data, clean):
+    """Linhas (nome, horas) já limpas e formatadas, ordenadas por horas."""
+    return [
+        (clean(player["name"]), str(round(player["hours"], 1)))
+        for player in sorted(team_data.values(), key=lambda x: x["hours"], reverse=True)
+    ]
+
+
+def draw_team_header(pdf, title, semestre):
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILY, "", 16)
+    pdf.cell(TITLE_WIDTH, 10, title, 0, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+    pdf.cell(TITLE_WIDTH, 10, f"Semestre: {semestre}", 0, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+    pdf.ln(10)
+
+    pdf.set_font(FONT_FAMILY, "", 12)
+    pdf.cell(NAME_WIDTH, ROW_HEIGHT, "Jogador", 1)
+    pdf.cell(HOURS_WIDTH, ROW_HEIGHT, "Horas", 1, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+def draw_rows(pdf, rows):
+    """
+    Desenha as linhas da tabela com rect/text em vez de uma chamada de cell por célula.
+    O resultado é o mesmo de cell(..., border=1) alinhado à esquerda, inclusive a quebra de página.
+    """
+    x = pdf.l_margin
+    y = pdf.get_y()
+    text_x = x + pdf.c_margin
+    hours_x = x + NAME_WIDTH
+    hours_text_x = hours_x + pdf.c_margin
+    baseline = 0.5 * ROW_HEIGHT + 0.3 * pdf.font_size
+    rect = pdf.rect
+    text = pdf.text
+
+    for name, hours in rows:
+        if y + ROW_HEIGHT > pdf.page_break_trigger:
+            pdf.add_page()
+            y = pdf.get_y()
+        rect(x, y, NAME_WIDTH, ROW_HEIGHT)
+        rect(hours_x, y, HOURS_WIDTH, ROW_HEIGHT)
+        if name:
+            text(text_x, y + baseline, name)
+        text(hours_text_x, y + baseline, hours)
+        y += ROW_HEIGHT
+    pdf.set_xy(x, y)
+
+
+def render_pdf(times_data, teams, semestre, clean):
+    """Mesmo documento do HorasPaeReporter.generate_pdf original, com custo fixo de setup menor."""
+    pdf = new_document()
+    for team_index, team_name in enumerate(teams):
+        team_data = times_data.get(team_name, {})
+        if not team_data:
+            logger.warning("No data for team '%s'", team_name)
+            continue
+
+        # O layout original deixa uma página em branco entre os times
+        if team_index > 0:
+            pdf.add_page()
+        draw_team_header(pdf, f"Relatório PAE - {clean(team_name)}", semestre)
+        draw_rows(pdf, team_rows(team_data, clean))
+
+    if not pdf.page_no():
+        raise ValueError("Nenhum dado disponível para gerar o PDF")
+    return pdf.output()
@@ -0,0 +1,103 @@
+import threading
+import time
+import traceback
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotRefresher:
+    """
+    Reconstrói o snapshot de dados em segundo plano a cada `interval` segundos.
+
+    `refresh` é a função que busca e processa os dados e grava o novo snapshot
+    no snapshot_cache; a troca é uma única atribuição sob o lock do cache, então
+    as requisições sempre leem um times_data completo (o antigo ou o novo).
+    Enquanto o refresh roda, fetch_data serve o snapshot expirado (stale-while-revalidate).
+    """
+    def __init__(self, interval, max_staleness):
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.refreshing = False
+        self.last_started_at = None
+        self.last_success_at = None
+        self.last_duration = None
+        self.last_error = None
+        self.refreshes = 0
+        self.failures = 0
+        self._refresh = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, refresh):
+        with self._lock:
+            if self.interval <= 0 or self.running:
+                return False
+            self._refresh = refresh
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+        logger.info("Started snapshot refresher (every %ss)", self.interval)
+        return True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """Pede um refresh imediato; ignorado se já houver um em andamento."""
+        if not self.refreshing:
+            self._wakeup.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.refresh_now()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def refresh_now(self):
+        self.refreshing = True
+        self.last_started_at = time.time()
+        started = time.perf_counter()
+        try:
+            self._refresh()
+            self.last_success_at = time.time()
+            self.last_error = None
+            self.refreshes += 1
+            logger.info("Refreshed snapshot in %.2fs", time.perf_counter() - started)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error("Snapshot refresh failed: %s", e)
+            traceback.print_exc()
+        finally:
+            self.last_duration = time.perf_counter() - started
+            self.refreshing = False
+
+    def status(self):
+        return {
+            "enabled": self.interval > 0,
+            "running": self.running,
+            "interval": self.interval,
+            "max_staleness": self.max_staleness,
+            "refreshing": self.refreshing,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_started_at": self.last_started_at,
+            "last_success_at": self.last_success_at,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+
+_config = Config()
+refresher = SnapshotRefresher(_config.REFRESH_INTERVAL, _config.REFRESH_MAX_STALENESS)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def times_data_version(times_data):
+    """Hash do conteúdo de times_data, usado para saber se um relatório renderizado ainda vale."""
+    payload = json.dumps(times_data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def report_key(fmt, teams, semester, data_version):
+    teams = teams if isinstance(teams, list) else [teams]
+    return (fmt, tuple(sorted(teams)), semester, data_version)
+
+
+def report_etag(key):
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class RenderedReport:
+    def __init__(self, data, etag, last_modified):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class RenderedReportCache:
+    """
+    Cache LRU dos bytes de PDF/XLSX já renderizados, limitado pelo tamanho total em bytes.
+    A chave é (formato, times ordenados, semestre, versão dos dados).
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, data, last_modified=None):
+        entry = RenderedReport(data, report_etag(key), last_modified or time.time())
+        if len(data) > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.data)
+            self._entries[key] = entry
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.data)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.size = 0
+        logger.info("Cleared %s rendered report(s)", count)
+        return count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "bytes": self.size,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+report_cache = RenderedReportCache(Config().REPORT_CACHE_MAX_BYTES)
@@ -0,0 +1,149 @@
+import time
+import uuid
+import threading
+import traceback
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ReportJob:
+    def __init__(self, fmt, teams, period=None):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.teams = teams
+        # (primeiro dia, último dia, rótulo) ou None para o semestre atual
+        self.period = period
+        self.status = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.data = None
+        self.filename = None
+        self.mimetype = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def set_progress(self, progress):
+        self.progress = progress
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "format": self.format,
+            "teams": self.teams,
+            "period": self.period[2] if self.period else None,
+            "status": self.status,
+            "progress": round(self.progress, 2),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReportJobManager:
+    """
+    Executa a geração de relatórios em um pool limitado de threads.
+    Recusa novos jobs quando há max_pending jobs na fila ou em execução, e
+    descarta jobs finalizados (e seus arquivos) depois de ttl segundos, ou antes,
+    dos mais antigos para os mais novos, quando os arquivos guardados passam de
+    max_bytes. O último job finalizado é sempre mantido, mesmo maior que o limite.
+    """
+    def __init__(self, max_workers, max_pending, ttl, max_bytes):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evicted = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs = {}
+        # job_id -> job, na ordem em que terminaram
+        self._finished = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fmt, teams, render, period=None):
+        """
+        Enfileira um job. `render(job)` deve retornar (data, filename, mimetype)
+        e pode atualizar job.progress durante a execução.
+        """
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Fila de relatórios cheia ({self.max_pending} jobs pendentes)")
+            job = ReportJob(fmt, teams, period)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, render)
+        logger.info("Queued report job %s (%s, teams: %s)", job.id, fmt, teams)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _run(self, job, render):
+        job.status = "running"
+        try:
+            job.data, job.filename, job.mimetype = render(job)
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as e:
+            logger.error("Report job %s failed: %s", job.id, e)
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+                self._finished[job.id] = job
+                self.size += len(job.data or b"")
+                self._evict()
+
+    def _expire(self):
+        now = time.time()
+        while self._finished:
+            job = next(iter(self._finished.values()))
+            if now - job.finished_at <= self.ttl:
+                break
+            self._discard(job)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._finished) > 1:
+            job = next(iter(self._finished.values()))
+            self._discard(job)
+            self.evicted += 1
+            logger.info("Evicted finished report job %s to stay under %s bytes", job.id, self.max_bytes)
+
+    def _discard(self, job):
+        del self._finished[job.id]
+        del self._jobs[job.id]
+        self.size -= len(job.data or b"")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "jobs": len(self._jobs),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+            }
+
+
+_config = Config()
+report_jobs = ReportJobManager(
+    _config.REPORT_JOB_WORKERS,
+    _config.REPORT_JOB_MAX_PENDING,
+    _config.REPORT_JOB_TTL,
+    _config.REPORT_JOB_MAX_BYTES
+)
@@ -0,0 +1,518 @@
+import calendar
+import threading
+import time
+import logging
+from array import array
+from datetime import date, datetime, timedelta
+from config import Config
+from train_aggregator import TrainAggregator, train_fingerprint, load_trains_dump
+from diagnostics import diagnostics
+
+logger = logging.getLogger(__name__)
+
+
+def day_bounds(start_day, end_day):
+    """Mesmo formato de get_current_semester_bounds: do início de start_day a 23:59:59 de end_day."""
+    start = datetime(start_day.year, start_day.month, start_day.day)
+    end = datetime(end_day.year, end_day.month, end_day.day, 23, 59, 59)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def semester_days(semester):
+    """'2024.1' -> (1º de janeiro, 30 de junho); '2024.2' -> (1º de julho, 31 de dezembro)."""
+    try:
+        year, half = semester.split(".")
+        year, half = int(year), int(half)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Semestre inválido: {semester} (use AAAA.1 ou AAAA.2)")
+    if half == 1:
+        return date(year, 1, 1), date(year, 6, 30)
+    if half == 2:
+        return date(year, 7, 1), date(year, 12, 31)
+    raise ValueError(f"Semestre inválido: {semester} (use AAAA.1 ou AAAA.2)")
+
+
+def parse_period(semester=None, start_date=None, end_date=None):
+    """
+    Converte os parâmetros de período de uma requisição em (primeiro dia, último dia, rótulo).
+    Retorna None quando nenhum período foi pedido; levanta ValueError se forem inválidos.
+    """
+    if semester and (start_date or end_date):
+        raise ValueError("Informe semester ou start_date/end_date, não ambos")
+    if semester:
+        start_day, end_day = semester_days(semester)
+        return start_day, end_day, semester
+    if not start_date and not end_date:
+        return None
+    if not (start_date and end_date):
+        raise ValueError("start_date e end_date devem ser informados juntos")
+    try:
+        start_day = date.fromisoformat(start_date)
+        end_day = date.fromisoformat(end_date)
+    except (TypeError, ValueError):
+        raise ValueError("Datas devem estar no formato AAAA-MM-DD")
+    if start_day > end_day:
+        raise ValueError("start_date deve ser anterior ou igual a end_date")
+    return start_day, end_day, f"{start_day.isoformat()}_{end_day.isoformat()}"
+
+
+class _ContributionCollector(TrainAggregator):
+    """Reaproveita a validação de add_train, guardando cada presença com seus timestamps."""
+    def __init__(self, modalidades):
+        super().__init__(modalidades, 0, float("inf"))
+        self.collected = []
+
+    def _add_attendance(self, player_id, modality_id, team_name, duration_ms, train_timestamp, entrance_ts, exit_ts):
+        self.collected.append((player_id, modality_id, duration_ms, train_timestamp, entrance_ts, exit_ts))
+
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _same_day(contribution, day_start, day_end):
+    entrance_ts, exit_ts = contribution[4], contribution[5]
+    return day_start <= entrance_ts <= day_end and day_start <= exit_ts <= day_end
+
+
+def _train_key(train):
+    if isinstance(train, dict) and train.get("_id") is not None:
+        return str(train["_id"])
+    return repr(train)
+
+
+def _new_bucket():
+    # players: player_id -> modality_id -> [ms, presenças, último treino]
+    # spanning: presenças que saem do dia do treino, filtradas por timestamp em cada consulta
+    return {"trains": 0, "players": {}, "spanning": []}
+
+
+class RollupIndex:
+    """
+    Totais de horas por jogador e modalidade, agregados por dia e por mês (data
+    local do StartTimestamp do treino). Um período em dias inteiros é respondido
+    somando os meses completos e os dias avulsos das pontas, sem reprocessar os
+    treinos; um semestre são seis meses.
+
+    Cada treino fica registrado por _id e fingerprint, então o mesmo lote pode ser
+    reingerido: treinos iguais são pulados e os alterados são substituídos. Isso
+    vale para os dias dentro da janela de revisão (revision_window_ms antes do
+    treino mais recente), os únicos que guardam as presenças de cada treino. Os
+    dias e meses anteriores são compactados em arrays, então a memória depende dos
+    agregados, não do histórico de presenças. Sem as presenças não dá para desfazer
+    a contribuição de um treino antigo: numa sincronização completa, treinos antigos
+    alterados ou removidos na API são contados em frozen_changes, e o índice deve
+    ser descartado e reconstruído (HorasPaeReporter.sync_rollups faz isso). Depois
+    de cada sincronização completa, o resultado é o mesmo de process_data com os
+    limites de day_bounds sobre a lista recebida.
+    """
+    def __init__(self, modalidades, revision_window_ms=0):
+        self.modalidades = modalidades
+        self.revision_window_ms = revision_window_ms
+        self.lock = threading.RLock()
+        self._collector = _ContributionCollector(modalidades)
+        # dia ou (ano, mês) -> bucket; os anteriores à janela ficam compactados (_freeze)
+        self._days = {}
+        self._months = {}
+        self._open_days = set()
+        self._open_months = set()
+        # (player_id, modality_id) <-> índice usado nos buckets compactados
+        self._pairs = {}
+        self._pair_keys = []
+        # Momento em que o último lote de treinos terminou de ser incorporado
+        self.synced_at = None
+        self.watermark = 0
+        # Dias anteriores a _cutoff estão fora da janela de revisão
+        self._cutoff = date.min
+        # train_key -> (fingerprint, dia, contribuições); dia None para treinos ignorados,
+        # contribuições None para treinos anteriores à janela
+        self._trains = {}
+        # dia -> train_keys com contribuições guardadas
+        self._retained = {}
+        # Treinos anteriores à janela alterados ou removidos na API; com algum, os totais
+        # estão desatualizados até o índice ser reconstruído
+        self.frozen_changes = 0
+        # Treinos vindos só do dump de TRAINS_BACKFILL_PATH
+        self._backfilled = set()
+        self.backfilled = False
+
+    def modality_names(self):
+        return {mod_id: mod.get("Name") for mod_id, mod in self.modalidades.items()}
+
+    def track(self, trains, complete=False):
+        """
+        Repassa os treinos de um iterável incorporando cada um nos rollups. Com
+        complete=True o iterável é a lista inteira da API: ao final, treinos que
+        não vieram mais são removidos, e treinos anteriores à janela também têm o
+        fingerprint conferido.
+        """
+        seen = set() if complete else None
+        frozen = self.frozen_changes
+        for train in trains:
+            with self.lock:
+                train_key = self._add(train, verify=complete)
+            if seen is not None and train_key is not None:
+                seen.add(train_key)
+            yield train
+        removed = 0
+        with self.lock:
+            if seen is not None:
+                missing = [
+                    train_key for train_key in self._trains
+                    if train_key not in seen and train_key not in self._backfilled
+                ]
+                for train_key in missing:
+                    if self._trains[train_key][2] is None:
+                        # Anterior à janela: as horas só saem reconstruindo o índice
+                        del self._trains[train_key]
+                        self.frozen_changes += 1
+                    else:
+                        self._remove(train_key)
+                        removed += 1
+                if self._backfilled:
+                    # Treinos do dump que a API passou a retornar seguem as regras dos demais
+                    self._backfilled.difference_update(seen)
+            self._freeze_before(self._cutoff)
+            frozen = self.frozen_changes - frozen
+        if removed:
+            logger.info("Removed %s trains no longer returned by the API from rollups", removed)
+        if frozen:
+            logger.info("%s trains before the revision window changed or disappeared upstream; rollups need a rebuild", frozen)
+        self.synced_at = time.time()
+        with self.lock:
+            anomalies = self._collector.take_anomalies()
+        diagnostics.finish("rollups", anomalies)
+
+    def ingest(self, trains, complete=False):
+        for _ in self.track(trains, complete):
+            pass
+
+    def backfill(self, path):
+        """
+        Completa o histórico com os treinos de um dump local de /trains/all que a API
+        não retornou. Eles não são removidos nem conferidos nas sincronizações completas.
+        """
+        trains = [train for train in load_trains_dump(path) if _train_key(train) not in self._trains]
+        logger.info("Backfilling rollups with %s trains from %s", len(trains), path)
+        self.ingest(trains)
+        self._backfilled.update(_train_key(train) for train in trains if isinstance(train, dict))
+        self.backfilled = True
+
+    def _add(self, train, verify=False):
+        if not isinstance(train, dict):
+            return None
+        train_key = _train_key(train)
+        previous = self._trains.get(train_key)
+        if previous is not None and previous[2] is None:
+            # Anterior à janela de revisão: sem as presenças, uma alteração só é registrada
+            if verify and previous[0] != train_fingerprint(train):
+                self.frozen_changes += 1
+            return train_key
+        fingerprint = None
+        if previous is not None:
+            fingerprint = train_fingerprint(train)
+            if previous[0] == fingerprint:
+                return train_key
+            self._remove(train_key)
+
+        collector = self._collector
+        collector.collected = []
+        if collector.add_train(train) is None:
+            # Registrado mesmo assim, para não repetir validação e avisos a cada fetch
+            self._trains[train_key] = (fingerprint or train_fingerprint(train), None, ())
+            return train_key
+
+        train_timestamp = train["StartTimestamp"]
+        day = datetime.fromtimestamp(train_timestamp / 1000).date()
+        day_start, day_end = day_bounds(day, day)
+        contributions = collector.collected
+        if day >= self._cutoff:
+            self._trains[train_key] = (fingerprint or train_fingerprint(train), day, contributions)
+            self._retained.setdefault(day, set()).add(train_key)
+        else:
+            self._trains[train_key] = (fingerprint or train_fingerprint(train), day, None)
+
+        same_day = []
+        spanning = []
+        for contribution in contributions:
+            (same_day if _same_day(contribution, day_start, day_end) else spanning).append(contribution)
+        for bucket in (self._day_bucket(day), self._month_bucket(day)):
+            bucket["trains"] += 1
+            players = bucket["players"]
+            for player_id, modality_id, duration_ms, *_ in same_day:
+                modalities = players.get(player_id)
+                if modalities is None:
+                    modalities = players[player_id] = {}
+                entry = modalities.get(modality_id)
+                if entry is None:
+                    modalities[modality_id] = [duration_ms, 1, train_timestamp]
+                    continue
+                entry[0] += duration_ms
+                entry[1] += 1
+                if train_timestamp > entry[2]:
+                    entry[2] = train_timestamp
+            bucket["spanning"].extend(spanning)
+        if train_timestamp > self.watermark:
+            self.watermark = train_timestamp
+            self._release(datetime.fromtimestamp(max(train_timestamp - self.revision_window_ms, 0) / 1000).date())
+        return train_key
+
+    def _release(self, cutoff):
+        """
+        Avança a janela de revisão descartando as presenças dos dias anteriores a `cutoff`;
+        os buckets desses dias são compactados ao final de track.
+        """
+        if cutoff <= self._cutoff:
+            return
+        self._cutoff = cutoff
+        for day in [day for day in self._retained if day < cutoff]:
+            for train_key in self._retained.pop(day):
+                self._trains[train_key] = (self._trains[train_key][0], day, None)
+
+    def _freeze_before(self, cutoff):
+        for day in [day for day in self._open_days if day < cutoff]:
+            frozen = self._freeze(self._days[day])
+            if frozen is not None:
+                self._days[day] = frozen
+                self._open_days.discard(day)
+        for month in [month for month in self._open_months if _month_end(*month) < cutoff]:
+            frozen = self._freeze(self._months[month])
+            if frozen is not None:
+                self._months[month] = frozen
+                self._open_months.discard(month)
+
+    def _pair(self, player_id, modality_id):
+        key = (player_id, modality_id)
+        pair = self._pairs.get(key)
+        if pair is None:
+            pair = self._pairs[key] = len(self._pair_keys)
+            self._pair_keys.append(key)
+        return pair
+
+    def _freeze(self, bucket):
+        """
+        Bucket compactado em arrays paralelos (par jogador/modalidade, ms, presenças, último
+        treino), ou None se algum valor for float (a API às vezes manda timestamps assim),
+        que não cabe em array("q"); nesse caso o bucket continua aberto.
+        """
+        entries = [
+            (self._pair(player_id, modality_id), values)
+            for player_id, modalities in bucket["players"].items()
+            for modality_id, values in modalities.items()
+        ]
+        spanning = [
+            (self._pair(player_id, modality_id), duration_ms, train_timestamp, entrance_ts, exit_ts)
+            for player_id, modality_id, duration_ms, train_timestamp, entrance_ts, exit_ts in bucket["spanning"]
+        ]
+        try:
+            return {
+                "trains": bucket["trains"],
+                "pairs": array("I", (pair for pair, _ in entries)),
+                "ms": array("q", (values[0] for _, values in entries)),
+                "attendances": array("I", (values[1] for _, values in entries)),
+                "last": array("q", (values[2] for _, values in entries)),
+                "spanning": tuple(array(typecode, column) for typecode, column in zip("Iqqqq", zip(*spanning)))
+                if spanning else (),
+            }
+        except TypeError:
+            return None
+
+    def _thaw(self, bucket):
+        players = {}
+        for pair, ms, attendances, last_train in zip(bucket["pairs"], bucket["ms"], bucket["attendances"], bucket["last"]):
+            player_id, modality_id = self._pair_keys[pair]
+            players.setdefault(player_id, {})[modality_id] = [ms, attendances, last_train]
+        return {"trains": bucket["trains"], "players": players, "spanning": list(self._spanning(bucket))}
+
+    def _entries(self, bucket):
+        """(player_id, modality_id, ms, presenças, último treino) de um bucket aberto ou compactado."""
+        if "players" in bucket:
+            for player_id, modalities in bucket["players"].items():
+                for modality_id, (ms, attendances, last_train) in modalities.items():
+                    yield player_id, modality_id, ms, attendances, last_train
+            return
+        pair_keys = self._pair_keys
+        for pair, ms, attendances, last_train in zip(bucket["pairs"], bucket["ms"], bucket["attendances"], bucket["last"]):
+            yield pair_keys[pair] + (ms, attendances, last_train)
+
+    def _spanning(self, bucket):
+        if "players" in bucket:
+            yield from bucket["spanning"]
+            return
+        pair_keys = self._pair_keys
+        for pair, *values in zip(*bucket["spanning"]):
+            yield pair_keys[pair] + tuple(values)
+
+    def _last_train(self, bucket, player_id, modality_id):
+        if "players" in bucket:
+            entry = bucket["players"].get(player_id, {}).get(modality_id)
+            return entry[2] if entry is not None else 0
+        pair = self._pairs.get((player_id, modality_id))
+        if pair is None or pair not in bucket["pairs"]:
+            return 0
+        return bucket["last"][bucket["pairs"].index(pair)]
+
+    def _remove(self, train_key):
+        _, day, contributions = self._trains.pop(train_key)
+        if day is None:
+            return
+        self._retained[day].discard(train_key)
+        day_start, day_end = day_bounds(day, day)
+        stale = set()
+        for bucket in (self._day_bucket(day), self._month_bucket(day)):
+            bucket["trains"] -= 1
+            for contribution in contributions:
+                player_id, modality_id, duration_ms, train_timestamp = contribution[:4]
+                if not _same_day(contribution, day_start, day_end):
+                    bucket["spanning"].remove(contribution)
+                    continue
+                modalities = bucket["players"][player_id]
+                entry = modalities[modality_id]
+                entry[0] -= duration_ms
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del modalities[modality_id]
+                    if not modalities:
+                        del bucket["players"][player_id]
+                elif entry[2] == train_timestamp:
+                    stale.add((player_id, modality_id))
+        if stale:
+            self._refresh_last_train(day, stale)
+
+    def _refresh_last_train(self, day, keys):
+        """
+        Recalcula o último treino do dia e do mês para entradas cujo máximo era o treino removido.
+        O dia está na janela de revisão, então todos os seus treinos guardam as presenças;
+        o mês é o máximo entre os seus dias.
+        """
+        day_last = dict.fromkeys(keys, 0)
+        day_start, day_end = day_bounds(day, day)
+        for train_key in self._retained.get(day, ()):
+            for contribution in self._trains[train_key][2]:
+                key = contribution[:2]
+                if key in day_last and _same_day(contribution, day_start, day_end):
+                    day_last[key] = max(day_last[key], contribution[3])
+        month_last = dict(day_last)
+        for other_day, bucket in self._days.items():
+            if other_day == day or (other_day.year, other_day.month) != (day.year, day.month):
+                continue
+            for key in keys:
+                month_last[key] = max(month_last[key], self._last_train(bucket, *key))
+        for bucket, last in ((self._days[day], day_last), (self._months[(day.year, day.month)], month_last)):
+            for (player_id, modality_id), train_timestamp in last.items():
+                entry = bucket["players"].get(player_id, {}).get(modality_id)
+                if entry is not None:
+                    entry[2] = train_timestamp
+
+    def _day_bucket(self, day):
+        bucket = self._days.get(day)
+        if bucket is None:
+            bucket = self._days[day] = _new_bucket()
+        elif "players" not in bucket:
+            bucket = self._days[day] = self._thaw(bucket)
+        self._open_days.add(day)
+        return bucket
+
+    def _month_bucket(self, day):
+        month = (day.year, day.month)
+        bucket = self._months.get(month)
+        if bucket is None:
+            bucket = self._months[month] = _new_bucket()
+        elif "players" not in bucket:
+            bucket = self._months[month] = self._thaw(bucket)
+        self._open_months.add(month)
+        return bucket
+
+    def _buckets(self, start_day, end_day):
+        """Meses inteiros dentro do período e, nas pontas, dias avulsos."""
+        current = start_day
+        while current <= end_day:
+            last_of_month = _month_end(current.year, current.month)
+            if current.day == 1 and last_of_month <= end_day:
+                bucket = self._months.get((current.year, current.month))
+                current = last_of_month + timedelta(days=1)
+            else:
+                bucket = self._days.get(current)
+                current += timedelta(days=1)
+            if bucket is not None:
+                yield bucket
+
+    def aggregate(self, start_day, end_day):
+        """
+        Monta um TrainAggregator já preenchido com as horas do período, pronto
+        para HorasPaeReporter.build_times_data.
+        """
+        start_ms, end_ms = day_bounds(start_day, end_day)
+        aggregator = TrainAggregator(self.modalidades, start_ms, end_ms)
+        player_hours = aggregator.player_hours
+
+        def add(player_id, modality_id, ms, attendances, last_train_date):
+            data = player_hours.get(player_id)
+            if data is None:
+                data = player_hours[player_id] = {"total_ms": 0, "teams": {}, "last_train_date": 0}
+            team = data["teams"].get(modality_id)
+            if team is None:
+                team = data["teams"][modality_id] = {
+                    "ms": 0,
+                    "attendances": 0,
+                    "team_name": self.modalidades[modality_id]["Name"]
+                }
+            team["ms"] += ms
+            team["attendances"] += attendances
+            data["total_ms"] += ms
+            if last_train_date > data["last_train_date"]:
+                data["last_train_date"] = last_train_date
+            aggregator.attendance_count += attendances
+
+        with self.lock:
+            for bucket in self._buckets(start_day, end_day):
+                aggregator.train_count += bucket["trains"]
+                for entry in self._entries(bucket):
+                    add(*entry)
+                for player_id, modality_id, duration_ms, train_timestamp, entrance_ts, exit_ts in self._spanning(bucket):
+                    if start_ms <= entrance_ts <= end_ms and start_ms <= exit_ts <= end_ms:
+                        add(player_id, modality_id, duration_ms, 1, train_timestamp)
+        return aggregator
+
+    def stats(self):
+        with self.lock:
+            return {
+                "trains": len(self._trains),
+                "retained_trains": sum(len(train_keys) for train_keys in self._retained.values()),
+                "frozen_changes": self.frozen_changes,
+                "days": len(self._days),
+                "open_days": len(self._open_days),
+                "months": len(self._months),
+                "synced_at": self.synced_at,
+                "spanning": sum(sum(1 for _ in self._spanning(bucket)) for bucket in self._days.values()),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_rollup_index(modalidades):
+    """
+    Índice de rollups do processo. É recriado quando as modalidades mudam, pois
+    treinos de modalidades antes desconhecidas precisariam ser reprocessados.
+    """
+    global _index
+    signature = {mod_id: mod.get("Name") for mod_id, mod in modalidades.items()}
+    with _index_lock:
+        if _index is None or _index.modality_names() != signature:
+            if _index is not None:
+                logger.info("Modalities changed, rebuilding rollups")
+            _index = RollupIndex(modalidades, Config().INCREMENTAL_REVISION_WINDOW * 1000)
+        return _index
+
+
+def current_rollup_index():
+    return _index
+
+
+def reset_rollup_index():
+    """Descarta o índice do processo; o próximo relatório de período o reconstrói do zero."""
+    global _index
+    with _index_lock:
+        _index = None
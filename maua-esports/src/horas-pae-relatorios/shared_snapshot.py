@@ -0,0 +1,323 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import logging
+from array import array
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from config import Config
+from atomic_file import atomic_write
+from compact_model import CompactModel
+from snapshot_cache import ReportSnapshot, snapshot_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem locks entre processos, cada worker busca os seus dados
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HPAESNAP"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sI")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _encode_strings(values):
+    """Strings concatenadas em UTF-8 e o array de offsets (n + 1) que as delimita; None vira ''."""
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for value in values:
+        blob += (value or "").encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, array("B", blob)
+
+
+class _StringTable(Sequence):
+    """Strings de um snapshot mapeado, decodificadas só quando acessadas."""
+    def __init__(self, offsets, blob, empty_as_none=False):
+        self.offsets = offsets
+        self.blob = blob
+        self.empty_as_none = empty_as_none
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        value = bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+        return None if self.empty_as_none and not value else value
+
+
+class _SortedIndex(Mapping):
+    """
+    String -> índice do jogador por busca binária em `order` (índices ordenados pela
+    string), no lugar do dicionário que cada worker teria de montar.
+    """
+    def __init__(self, table, order):
+        self.table = table
+        self.order = order
+
+    def __getitem__(self, key):
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            value = self.table[self.order[middle]]
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return self.order[middle]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return (self.table[index] for index in self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+
+def write_snapshot(path, key, snapshot):
+    """
+    Grava o snapshot em um arquivo binário: prefixo (MAGIC, tamanho do cabeçalho),
+    cabeçalho JSON com modalidades, times e a posição de cada seção, e as seções
+    (arrays do CompactModel e tabelas de strings) alinhadas em 8 bytes. A gravação
+    é feita em um temporário trocado de uma vez, então leitores nunca veem um
+    arquivo pela metade e quem já mapeou o anterior continua com ele.
+    """
+    model = snapshot.model
+    team_starts = array("I", [0])
+    team_members = array("I")
+    for team in range(len(model.team_names)):
+        team_members.extend(model.team_rankings[team])
+        team_starts.append(len(team_members))
+    player_id_offsets, player_id_blob = _encode_strings(model.player_ids)
+    ra_offsets, ra_blob = _encode_strings(model.ras)
+    sections = {
+        "teams": model.teams,
+        "hours": model.hours,
+        "last_train": model.last_train,
+        "team_rank": model.team_rank,
+        "overall_rank": model.overall_rank,
+        "leaderboard": model.leaderboard,
+        "team_starts": team_starts,
+        "team_members": team_members,
+        "player_id_offsets": player_id_offsets,
+        "player_id_blob": player_id_blob,
+        "ra_offsets": ra_offsets,
+        "ra_blob": ra_blob,
+        "player_id_order": array("I", sorted(range(len(model.player_ids)), key=model.player_ids.__getitem__)),
+        "ra_order": array("I", sorted(
+            (index for index, ra in enumerate(model.ras) if ra is not None), key=model.ras.__getitem__
+        )),
+    }
+
+    layout = {}
+    position = 0
+    for name, values in sections.items():
+        position = _align(position)
+        layout[name] = [values.typecode, position, len(values)]
+        position += values.itemsize * len(values)
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "key": list(key),
+        "version": snapshot.version,
+        "created_at": snapshot.created_at,
+        "modalidades": snapshot.modalidades,
+        "team_names": model.team_names,
+        "sections": layout,
+    }).encode("utf-8")
+    base = _align(_PREFIX.size + len(header))
+
+    with atomic_write(path, prefix=".horas-pae-snapshot-") as f:
+        f.write(_PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, values in sections.items():
+            f.write(b"\0" * (base + layout[name][1] - f.tell()))
+            f.write(values)
+
+
+def read_snapshot(path):
+    """
+    Mapeia o arquivo gravado por write_snapshot e retorna (chave, ReportSnapshot).
+    Os arrays do CompactModel são memoryviews sobre o mmap: as páginas ficam no
+    page cache do sistema e são compartilhadas por todos os workers que o leem.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, header_size = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} não é um snapshot compartilhado")
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_size]))
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Formato de snapshot não suportado: {header.get('format')}")
+    base = _align(_PREFIX.size + header_size)
+    view = memoryview(buffer)
+
+    def section(name):
+        typecode, offset, count = header["sections"][name]
+        start = base + offset
+        return view[start:start + array(typecode).itemsize * count].cast(typecode)
+
+    model = CompactModel(header["version"])
+    model.team_names = header["team_names"]
+    model.team_index = {team_name: team for team, team_name in enumerate(model.team_names)}
+    model.player_ids = _StringTable(section("player_id_offsets"), section("player_id_blob"))
+    model.ras = _StringTable(section("ra_offsets"), section("ra_blob"), empty_as_none=True)
+    model.player_index = _SortedIndex(model.player_ids, section("player_id_order"))
+    model._ra_index = _SortedIndex(model.ras, section("ra_order"))
+    for name in ("teams", "hours", "last_train", "team_rank", "overall_rank", "leaderboard"):
+        setattr(model, name, section(name))
+    team_starts = section("team_starts")
+    team_members = section("team_members")
+    model.team_rankings = {
+        team: team_members[team_starts[team]:team_starts[team + 1]] for team in range(len(model.team_names))
+    }
+    snapshot = ReportSnapshot(header["modalidades"], model, header["version"], header["created_at"])
+    return tuple(header["key"]), snapshot
+
+
+class SharedSnapshotStore:
+    """
+    Snapshot publicado em `path` para todos os workers do servidor. Quem busca os
+    dados grava o arquivo (publish); os demais o mapeiam (sync) e passam a usá-lo
+    no snapshot_cache do processo, sem buscar nem processar nada. Sem `path`,
+    todas as operações são no-ops e cada processo mantém o seu snapshot.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.publishes = 0
+        self.adopted = 0
+        self.errors = 0
+        # (assinatura do arquivo, chave, snapshot) da última versão publicada ou lida
+        self._loaded = None
+        self._leader_fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    @staticmethod
+    def _signature(stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def publish(self, key, snapshot):
+        if not self.path or snapshot_cache.ttl <= 0 or snapshot.model is None:
+            return
+        try:
+            write_snapshot(self.path, key, snapshot)
+            signature = self._signature(os.stat(self.path))
+        except (OSError, TypeError, ValueError) as e:
+            self.errors += 1
+            logger.warning("Could not publish shared snapshot to %s: %s", self.path, e)
+            return
+        with self._lock:
+            self._loaded = (signature, key, snapshot)
+            self.publishes += 1
+        logger.info("Published shared snapshot %s to %s", snapshot.version, self.path)
+
+    def sync(self, key):
+        """
+        Adota no snapshot_cache a versão mais recente publicada para `key`, se for
+        mais nova que a do processo, e a retorna (None se não houver). Custa um
+        stat por chamada; o arquivo só é mapeado de novo quando muda.
+        """
+        if not self.path:
+            return None
+        with self._lock:
+            try:
+                signature = self._signature(os.stat(self.path))
+            except FileNotFoundError:
+                if self._loaded is not None:
+                    # Apagado por uma invalidação em outro worker
+                    snapshot_cache.invalidate(self._loaded[1])
+                    self._loaded = None
+                return None
+            except OSError as e:
+                logger.warning("Could not stat shared snapshot %s: %s", self.path, e)
+                return None
+
+            if self._loaded is None or self._loaded[0] != signature:
+                try:
+                    loaded_key, snapshot = read_snapshot(self.path)
+                except (OSError, ValueError, KeyError) as e:
+                    self.errors += 1
+                    logger.warning("Could not read shared snapshot %s: %s", self.path, e)
+                    return None
+                self._loaded = (signature, loaded_key, snapshot)
+                current = snapshot_cache.peek(loaded_key)
+                if current is None or current.created_at < snapshot.created_at:
+                    snapshot_cache.put(loaded_key, snapshot)
+                    self.adopted += 1
+                    logger.info("Adopted shared snapshot %s (%.0fs old)", snapshot.version, snapshot.age())
+
+            _, loaded_key, snapshot = self._loaded
+            return snapshot if loaded_key == tuple(key) else None
+
+    def invalidate(self):
+        if not self.path:
+            return
+        with self._lock:
+            self._loaded = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def build_lock(self):
+        """Lock entre processos para que só um worker busque e processe os dados por vez."""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def is_leader(self):
+        """
+        Elege, com um flock não bloqueante mantido enquanto o processo vive, o worker
+        cujo refresher busca os dados; se ele morrer, outro assume no próximo ciclo.
+        """
+        if not self.path or fcntl is None:
+            return True
+        with self._lock:
+            if self._leader_fd is None:
+                fd = os.open(self.path + ".leader", os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    return False
+                self._leader_fd = fd
+                logger.info("Worker %s now refreshes the shared snapshot", os.getpid())
+            return True
+
+    def stats(self):
+        with self._lock:
+            loaded = self._loaded
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "leader": self._leader_fd is not None,
+            "version": loaded[2].version if loaded else None,
+            "publishes": self.publishes,
+            "adopted": self.adopted,
+            "errors": self.errors,
+        }
+
+
+shared_snapshots = SharedSnapshotStore(Config().SHARED_SNAPSHOT_PATH)
@@ -0,0 +1,66 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas simultâneas com a mesma chave: a primeira executa a função
+    e as que chegam enquanto ela roda esperam e recebem o mesmo resultado (ou erro).
+    Nada é guardado depois que a chamada termina; cache é papel de quem chama.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.executions = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Retorna (resultado, shared); shared é True para quem aproveitou a chamada de outro."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            logger.info("Waiting for in-flight %s %s", self.name, key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "shared": self.shared,
+            }
+
+
+data_fetches = SingleFlight("data fetch")
+report_renders = SingleFlight("report render")
@@ -0,0 +1,92 @@
+import threading
+import time
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ReportSnapshot:
+    """
+    Resultado de um fetch_data: modalidades e o CompactModel com as horas já
+    processadas. Os treinos brutos não são guardados. Os dados são compartilhados
+    entre requisições e devem ser tratados como somente leitura.
+    """
+    def __init__(self, modalidades, model, version, created_at=None):
+        self.modalidades = modalidades
+        self.model = model
+        self.version = version
+        self.created_at = created_at or time.time()
+
+    def age(self):
+        return time.time() - self.created_at
+
+
+class SnapshotCache:
+    """
+    Cache de snapshots por processo, com TTL, invalidação explícita e contadores de hit/miss.
+    A chave é o intervalo (start_date, end_date) usado no processamento.
+    Snapshots expirados continuam guardados até serem substituídos, para que
+    get_stale possa servi-los enquanto o refresher reconstrói os dados.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None and snapshot.age() >= self.ttl:
+                snapshot = None
+            if snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return snapshot
+
+    def get_stale(self, key, max_age):
+        """Snapshot expirado com até max_age segundos, ou None."""
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is None or snapshot.age() >= max_age:
+                return None
+            self.stale_hits += 1
+            return snapshot
+
+    def peek(self, key):
+        """Snapshot atual, expirado ou não, sem afetar os contadores."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, snapshot):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = snapshot
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                count = len(self._entries)
+                self._entries.clear()
+            else:
+                count = 1 if self._entries.pop(key, None) is not None else 0
+        logger.info("Invalidated %s snapshot(s)", count)
+        return count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+            }
+
+
+snapshot_cache = SnapshotCache(Config().SNAPSHOT_TTL)
@@ -0,0 +1,296 @@
+import json
+import hashlib
+import threading
+import logging
+from diagnostics import AnomalyCounter
+
+logger = logging.getLogger(__name__)
+
+HOUR_MS = 1000 * 60 * 60
+
+
+def train_fingerprint(train):
+    """
+    Fingerprint estável (entre processos) dos campos de um treino que afetam as horas.
+    """
+    if isinstance(train, dict):
+        fields = (
+            train.get("Status"),
+            train.get("StartTimestamp"),
+            train.get("ModalityId"),
+            train.get("AttendedPlayers"),
+        )
+    else:
+        fields = train
+    digest = hashlib.blake2b(repr(fields).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def load_trains_dump(path):
+    """Lê um dump local de /trains/all (lista JSON de treinos)."""
+    with open(path, encoding="utf-8") as dump:
+        trains = json.load(dump)
+    if not isinstance(trains, list):
+        raise ValueError(f"Expected list of trains in backfill file {path}")
+    return trains
+
+
+class TrainAggregator:
+    """
+    Acumula as horas de cada jogador por time a partir dos treinos ENDED
+    dentro de [start_date, end_date]. As durações são somadas em milissegundos
+    inteiros, então o resultado não depende da ordem em que os treinos chegam.
+    Registros inválidos são contados em `anomalies` em vez de logados um a um.
+    """
+    def __init__(self, modalidades, start_date, end_date):
+        self.modalidades = modalidades
+        self.start_date = start_date
+        self.end_date = end_date
+        self.player_hours = {}
+        self.train_count = 0
+        self.attendance_count = 0
+        self.anomalies = AnomalyCounter()
+
+    def add_train(self, train):
+        """
+        Incorpora um treino. Retorna a lista de contribuições
+        (player_id, modality_id, duration_ms, train_timestamp) ou None se o treino foi ignorado.
+        """
+        if not isinstance(train, dict):
+            self.anomalies.record("invalid_train", train)
+            return None
+        if train.get("Status") != "ENDED":
+            return None
+        train_timestamp = train.get("StartTimestamp")
+        if not train_timestamp or not (self.start_date <= train_timestamp <= self.end_date):
+            return None
+        if train.get("ModalityId") in (None, ""):
+            self.anomalies.record("missing_modality_id", train.get("_id"))
+            return None
+        modality_id = str(train["ModalityId"])
+        modality = self.modalidades.get(modality_id)
+        if not modality:
+            self.anomalies.record("unknown_modality", {"train": train.get("_id"), "ModalityId": modality_id})
+            return None
+        attended_players = train.get("AttendedPlayers", [])
+        if not isinstance(attended_players, list):
+            self.anomalies.record("malformed_attendance", {"train": train.get("_id"), "AttendedPlayers": attended_players})
+            return None
+
+        self.train_count += 1
+        contributions = []
+        for player in attended_players:
+            try:
+                if not ("PlayerId" in player and "EntranceTimestamp" in player and "ExitTimestamp" in player):
+                    self.anomalies.record("malformed_attendance", player)
+                    continue
+                entrance_ts = player["EntranceTimestamp"]
+                exit_ts = player["ExitTimestamp"]
+                if not (self.start_date <= entrance_ts <= self.end_date) or not (self.start_date <= exit_ts <= self.end_date):
+                    self.anomalies.record("attendance_out_of_window", player)
+                    continue
+                player_id = str(player["PlayerId"])
+                duration_ms = exit_ts - entrance_ts
+            except (TypeError, KeyError):
+                self.anomalies.record("malformed_attendance", player)
+                continue
+
+            self._add_attendance(player_id, modality_id, modality["Name"], duration_ms, train_timestamp, entrance_ts, exit_ts)
+            contributions.append((player_id, modality_id, duration_ms, train_timestamp))
+        return contributions
+
+    def _add_attendance(self, player_id, modality_id, team_name, duration_ms, train_timestamp, entrance_ts, exit_ts):
+        data = self.player_hours.get(player_id)
+        if data is None:
+            data = self.player_hours[player_id] = {
+                "total_ms": 0,
+                "teams": {},
+                "last_train_date": 0
+            }
+        team = data["teams"].get(modality_id)
+        if team is None:
+            team = data["teams"][modality_id] = {
+                "ms": 0,
+                "attendances": 0,
+                "team_name": team_name
+            }
+        team["ms"] += duration_ms
+        team["attendances"] += 1
+        data["total_ms"] += duration_ms
+        if train_timestamp > data["last_train_date"]:
+            data["last_train_date"] = train_timestamp
+        self.attendance_count += 1
+
+    def player_ids(self):
+        return list(self.player_hours.keys())
+
+    def take_anomalies(self):
+        """Devolve as anomalias acumuladas e recomeça a contagem (agregadores de longa duração)."""
+        anomalies, self.anomalies = self.anomalies, AnomalyCounter()
+        return anomalies
+
+    def build_times_data(self, user_map):
+        """
+        Monta times_data atribuindo cada jogador ao time principal (com mais horas).
+        """
+        times_data = {mod["Name"]: {} for mod in self.modalidades.values()}
+        for player_id, data in self.player_hours.items():
+            if not data["teams"]:
+                self.anomalies.record("player_without_team", player_id)
+                continue
+            main_team_id = max(data["teams"], key=lambda k: data["teams"][k]["ms"])
+            main_team_name = data["teams"][main_team_id]["team_name"]
+            if main_team_name in times_data:
+                times_data[main_team_name][player_id] = {
+                    "name": user_map.get(player_id, {}).get("ra", player_id),
+                    "hours": data["total_ms"] / HOUR_MS,
+                    "team": main_team_name,
+                    "last_train_date": data["last_train_date"]
+                }
+            else:
+                self.anomalies.record("unknown_main_team", {"player": player_id, "team": main_team_name})
+        return times_data
+
+
+class IncrementalTrainAggregator(TrainAggregator):
+    """
+    Agregador de longa duração que incorpora apenas treinos novos ou alterados.
+
+    O watermark é o maior StartTimestamp já incorporado. Treinos anteriores a
+    watermark - revision_window são pulados sem inspeção; os demais são comparados
+    por fingerprint e, se mudaram, têm a contribuição antiga removida antes de serem somados de novo.
+    Quando o lote é a lista inteira da API, treinos da janela que sumiram dela também são removidos.
+    Edições em treinos anteriores à janela só entram quando o agregador é descartado
+    (POST /api/cache/invalidate) e o histórico é reprocessado.
+    """
+    def __init__(self, modalidades, start_date, end_date, revision_window_ms):
+        super().__init__(modalidades, start_date, end_date)
+        self.revision_window_ms = revision_window_ms
+        self.watermark = 0
+        self.lock = threading.RLock()
+        # train_key -> (fingerprint, contribuições, StartTimestamp)
+        self._folded = {}
+
+    def since(self):
+        """Menor StartTimestamp que ainda pode trazer treinos novos ou alterados."""
+        return max(self.watermark - self.revision_window_ms, 0)
+
+    def ingest(self, trains, complete=False):
+        """
+        Incorpora um lote de treinos e retorna quantos foram (re)processados. Com
+        complete=True o lote é a resposta sem filtro de data de /trains/all, então
+        treinos da janela de revisão já incorporados que não vieram são removidos.
+        """
+        with self.lock:
+            cutoff = self.since()
+            processed = 0
+            stale_players = set()
+            seen = set() if complete else None
+            for train in trains:
+                train_timestamp = train.get("StartTimestamp") if isinstance(train, dict) else None
+                if isinstance(train_timestamp, (int, float)) and train_timestamp < cutoff:
+                    continue
+                train_key = self._train_key(train)
+                if seen is not None:
+                    seen.add(train_key)
+                fingerprint = train_fingerprint(train)
+                previous = self._folded.get(train_key)
+                if previous is not None:
+                    if previous[0] == fingerprint:
+                        continue
+                    stale_players.update(self._remove(previous[1]))
+                    del self._folded[train_key]
+
+                contributions = self.add_train(train)
+                processed += 1
+                if contributions is not None:
+                    self._folded[train_key] = (fingerprint, contributions, train_timestamp)
+                    self.watermark = max(self.watermark, train_timestamp)
+
+            if seen is not None:
+                missing = [
+                    train_key for train_key, (_, _, train_timestamp) in self._folded.items()
+                    if train_timestamp >= cutoff and train_key not in seen
+                ]
+                for train_key in missing:
+                    stale_players.update(self._remove(self._folded.pop(train_key)[1]))
+                if missing:
+                    logger.info("Removed %s trains no longer returned by the API", len(missing))
+            if stale_players:
+                self._refresh_last_train_dates(stale_players)
+            logger.info("Incremental ingestion processed %s trains (watermark: %s)", processed, self.watermark)
+            return processed
+
+    def backfill(self, path):
+        """
+        Carrega o histórico de um dump local de /trains/all, usado quando a API
+        não oferece filtro por data para a carga inicial.
+        """
+        trains = load_trains_dump(path)
+        logger.info("Backfilling %s trains from %s", len(trains), path)
+        return self.ingest(trains)
+
+    def modality_names(self):
+        return {mod_id: mod.get("Name") for mod_id, mod in self.modalidades.items()}
+
+    def _train_key(self, train):
+        if isinstance(train, dict) and train.get("_id") is not None:
+            return str(train["_id"])
+        return repr(train)
+
+    def _remove(self, contributions):
+        """Desfaz as contribuições de um treino; retorna jogadores cujo last_train_date precisa ser recalculado."""
+        stale_players = set()
+        self.train_count -= 1
+        for player_id, modality_id, duration_ms, train_timestamp in contributions:
+            data = self.player_hours[player_id]
+            team = data["teams"][modality_id]
+            team["ms"] -= duration_ms
+            team["attendances"] -= 1
+            data["total_ms"] -= duration_ms
+            self.attendance_count -= 1
+            if team["attendances"] == 0:
+                del data["teams"][modality_id]
+            if not data["teams"]:
+                del self.player_hours[player_id]
+                stale_players.discard(player_id)
+            elif data["last_train_date"] == train_timestamp:
+                stale_players.add(player_id)
+        return stale_players
+
+    def _refresh_last_train_dates(self, player_ids):
+        player_ids = {player_id for player_id in player_ids if player_id in self.player_hours}
+        for player_id in player_ids:
+            self.player_hours[player_id]["last_train_date"] = 0
+        for _, contributions, _ in self._folded.values():
+            for player_id, _, _, train_timestamp in contributions:
+                if player_id in player_ids and train_timestamp > self.player_hours[player_id]["last_train_date"]:
+                    self.player_hours[player_id]["last_train_date"] = train_timestamp
+
+
+_incremental_aggregators = {}
+_incremental_lock = threading.Lock()
+
+
+def get_incremental_aggregator(modalidades, start_date, end_date, revision_window_ms):
+    """
+    Retorna o agregador incremental do processo para o intervalo informado.
+    Um novo agregador é criado quando as modalidades mudam, já que treinos
+    antigos de modalidades desconhecidas precisariam ser reprocessados.
+    """
+    key = (start_date, end_date)
+    signature = {mod_id: mod.get("Name") for mod_id, mod in modalidades.items()}
+    with _incremental_lock:
+        aggregator = _incremental_aggregators.get(key)
+        if aggregator is None or aggregator.modality_names() != signature:
+            if aggregator is not None:
+                logger.info("Modalities changed, rebuilding incremental aggregates")
+            aggregator = IncrementalTrainAggregator(modalidades, start_date, end_date, revision_window_ms)
+            _incremental_aggregators[key] = aggregator
+        return aggregator
+
+
+def reset_incremental_aggregators():
+    """Descarta os agregadores incrementais; chamado por /api/cache/invalidate."""
+    with _incremental_lock:
+        _incremental_aggregators.clear()
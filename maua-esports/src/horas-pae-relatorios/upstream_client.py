@@ -0,0 +1,147 @@
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from json_stream import iter_json_array
+from metrics import upstream_request_seconds, upstream_response_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamClient:
+    """
+    Cliente HTTP da API de esports: conexões keep-alive reaproveitadas,
+    retry com backoff, gzip, requisições em paralelo e estatísticas de latência por endpoint.
+    """
+    def __init__(self, base_url, token, pool_size=10, max_workers=4, retries=3,
+                 backoff_factor=0.5, timeout=60, user_chunk_size=100):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.user_chunk_size = user_chunk_size
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upstream")
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, path, params=None, timeout=None, stream=False):
+        started = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{self.base_url}{path}",
+                params=params,
+                timeout=timeout or self.timeout,
+                stream=stream
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            self._record(path, time.perf_counter() - started, error=True)
+            raise
+        self._record(path, time.perf_counter() - started)
+        # Em streaming o corpo ainda não foi lido; usa o tamanho (comprimido) informado pelo servidor
+        size = response.headers.get("Content-Length") if stream else len(response.content)
+        if size is not None:
+            upstream_response_bytes.observe(int(size), path=path)
+        return response
+
+    def get_json(self, path, params=None, timeout=None):
+        return self.get(path, params=params, timeout=timeout).json()
+
+    def stream_json_array(self, path, params=None, timeout=None, chunk_size=64 * 1024):
+        """
+        Itera os elementos de um array JSON à medida que a resposta chega,
+        sem carregar o corpo inteiro (já descomprimido do gzip) em memória.
+        """
+        response = self.get(path, params=params, timeout=timeout, stream=True)
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size=chunk_size))
+        finally:
+            response.close()
+
+    def fetch_modalities_and_trains(self, trains_params=None):
+        """Busca /modality/all e /trains/all em paralelo."""
+        modalities = self._executor.submit(self.get_json, "/modality/all")
+        trains = self._executor.submit(self.get_json, "/trains/all", trains_params)
+        return modalities.result(), trains.result()
+
+    def fetch_users(self, discord_ids):
+        """
+        Busca /usuarios/por-discord-ids em lotes de até user_chunk_size IDs, em paralelo,
+        evitando URLs gigantes para elencos grandes.
+        """
+        discord_ids = list(discord_ids)
+        chunks = [
+            discord_ids[i:i + self.user_chunk_size]
+            for i in range(0, len(discord_ids), self.user_chunk_size)
+        ]
+        futures = [
+            self._executor.submit(self.get_json, "/usuarios/por-discord-ids", {"ids": ",".join(chunk)})
+            for chunk in chunks
+        ]
+        users = []
+        for future in futures:
+            users.extend(future.result())
+        return users
+
+    def _record(self, path, elapsed, error=False):
+        upstream_request_seconds.observe(elapsed, path=path, outcome="error" if error else "ok")
+        with self._stats_lock:
+            stats = self._stats.setdefault(path, {
+                "count": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+            })
+            stats["count"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            if error:
+                stats["errors"] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                path: {**stats, "avg_seconds": stats["total_seconds"] / stats["count"]}
+                for path, stats in self._stats.items()
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream_client(config):
+    """Cliente compartilhado pelo processo, para que o pool de conexões sobreviva entre requisições."""
+    key = (config.API_BASE_URL, config.API_TOKEN)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = UpstreamClient(
+                config.API_BASE_URL,
+                config.API_TOKEN,
+                pool_size=config.UPSTREAM_POOL_SIZE,
+                max_workers=config.UPSTREAM_MAX_WORKERS,
+                retries=config.UPSTREAM_RETRIES,
+                backoff_factor=config.UPSTREAM_BACKOFF,
+                timeout=config.UPSTREAM_TIMEOUT,
+                user_chunk_size=config.USER_IDS_CHUNK_SIZE
+            )
+        return client
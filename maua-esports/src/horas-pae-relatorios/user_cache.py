@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from config import Config
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Cache Discord ID -> {"email", "ra"} com TTL e limite LRU. IDs que a API de
+    usuários não conhece ficam como entradas negativas (None), com TTL próprio,
+    para não serem buscados a cada relatório. Com `path`, o cache é carregado do
+    disco na criação e regravado depois de cada busca que o altera.
+    """
+    def __init__(self, ttl, negative_ttl, max_entries, path=""):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.fetch_errors = 0
+        # discord_id -> (usuário ou None, momento da busca)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def _fresh(self, user, fetched_at, now):
+        return now - fetched_at < (self.ttl if user is not None else self.negative_ttl)
+
+    def resolve(self, discord_ids, fetch):
+        """
+        Retorna o mapa Discord ID -> usuário para os IDs conhecidos. Só os IDs ausentes
+        ou expirados são passados a `fetch`, que deve devolver o mapa dos que a API encontrou.
+        Se `fetch` falhar, entradas expiradas ainda são usadas no lugar de nada.
+        """
+        discord_ids = list(discord_ids)
+        now = time.time()
+        user_map = {}
+        missing = []
+        stale = {}
+        with self._lock:
+            for discord_id in discord_ids:
+                entry = self._entries.get(discord_id)
+                if entry is not None and self._fresh(entry[0], entry[1], now):
+                    self._entries.move_to_end(discord_id)
+                    if entry[0] is not None:
+                        user_map[discord_id] = entry[0]
+                    continue
+                if entry is not None and entry[0] is not None:
+                    stale[discord_id] = entry[0]
+                missing.append(discord_id)
+            self.hits += len(discord_ids) - len(missing)
+            self.misses += len(missing)
+
+        if not missing:
+            return user_map
+
+        try:
+            fetched = fetch(missing)
+        except Exception as e:
+            with self._lock:
+                self.fetch_errors += 1
+                self.stale_served += len(stale)
+            logger.warning("User lookup failed for %s IDs, serving %s stale entries: %s", len(missing), len(stale), e)
+            user_map.update(stale)
+            return user_map
+
+        now = time.time()
+        with self._lock:
+            for discord_id in missing:
+                user = fetched.get(discord_id)
+                self._entries[discord_id] = (user, now)
+                self._entries.move_to_end(discord_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        user_map.update(fetched)
+        logger.info("Cached %s users and %s unknown IDs", len(fetched), len(missing) - len(fetched))
+        if self.path:
+            self.save()
+        return user_map
+
+    def load(self):
+        """Warm start: carrega as entradas gravadas, descartando as já expiradas."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load user cache from %s: %s", self.path, e)
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for discord_id, user, fetched_at in data.get("entries", []):
+                if self._fresh(user, fetched_at, now):
+                    self._entries[discord_id] = (user, fetched_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            count = len(self._entries)
+        logger.info("Loaded %s cached users from %s", count, self.path)
+        return count
+
+    def save(self):
+        """Grava em um arquivo temporário e troca de uma vez, para nunca deixar um JSON pela metade."""
+        with self._lock:
+            entries = [[discord_id, user, fetched_at] for discord_id, (user, fetched_at) in self._entries.items()]
+        try:
+            with atomic_write(self.path, "w", prefix=".user-cache-", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f)
+        except OSError as e:
+            logger.warning("Could not save user cache to %s: %s", self.path, e)
+
+    def clear(self):
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+        if self.path:
+            self.save()
+        logger.info("Cleared %s cached user(s)", count)
+        return count
+
+    def stats(self):
+        with self._lock:
+            negative = sum(1 for user, _ in self._entries.values() if user is None)
+            return {
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "max_entries": self.max_entries,
+                "entries": len(self._entries),
+                "negative_entries": negative,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_served": self.stale_served,
+                "fetch_errors": self.fetch_errors,
+            }
+
+
+_config = Config()
+user_cache = UserCache(
+    _config.USER_CACHE_TTL,
+    _config.USER_CACHE_NEGATIVE_TTL,
+    _config.USER_CACHE_MAX_ENTRIES,
+    _config.USER_CACHE_PATH
+)
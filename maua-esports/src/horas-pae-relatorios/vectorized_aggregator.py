@@ -0,0 +1,86 @@
+import logging
+import numpy as np
+import pandas as pd
+from train_aggregator import TrainAggregator, HOUR_MS
+
+logger = logging.getLogger(__name__)
+
+
+class VectorizedTrainAggregator(TrainAggregator):
+    """
+    Mesmo contrato do TrainAggregator, mas as presenças válidas são apenas achatadas
+    em colunas (jogador, modalidade, duração, início do treino) durante add_train.
+    Horas, totais por time, time principal e last_train_date são calculados
+    depois, com operações agrupadas do pandas/NumPy.
+    """
+    def __init__(self, modalidades, start_date, end_date):
+        super().__init__(modalidades, start_date, end_date)
+        self._players = []
+        self._modalities = []
+        self._durations = []
+        self._train_timestamps = []
+        self._result = None
+
+    def _add_attendance(self, player_id, modality_id, team_name, duration_ms, train_timestamp, entrance_ts, exit_ts):
+        self._players.append(player_id)
+        self._modalities.append(modality_id)
+        self._durations.append(duration_ms)
+        self._train_timestamps.append(train_timestamp)
+        self.attendance_count += 1
+        self._result = None
+
+    def player_ids(self):
+        return self._aggregate()["player_ids"]
+
+    def _aggregate(self):
+        if self._result is not None:
+            return self._result
+
+        # factorize sem ordenar preserva a ordem da primeira aparição, como os dicts do caminho em Python
+        player_codes, player_ids = pd.factorize(pd.Series(self._players, dtype=object), sort=False)
+        modality_codes, modality_ids = pd.factorize(pd.Series(self._modalities, dtype=object), sort=False)
+        attendances = pd.DataFrame({
+            "player": player_codes,
+            "modality": modality_codes,
+            "duration": np.asarray(self._durations),
+            "train_timestamp": np.asarray(self._train_timestamps),
+        })
+
+        by_player = attendances.groupby("player", sort=True)
+        totals = by_player["duration"].sum()
+        last_train_dates = by_player["train_timestamp"].max()
+
+        # Horas por (jogador, time); empates no time principal ficam com o time visto primeiro
+        per_team = attendances.groupby(["player", "modality"], sort=False)["duration"].sum().reset_index()
+        main_teams = (
+            per_team.sort_values(["player", "duration"], ascending=[True, False], kind="mergesort")
+            .drop_duplicates("player", keep="first")
+            .set_index("player")["modality"]
+            .sort_index()
+        )
+
+        self._result = {
+            "player_ids": list(player_ids),
+            "total_ms": totals.tolist(),
+            "last_train_date": last_train_dates.tolist(),
+            "main_team_id": [modality_ids[code] for code in main_teams.tolist()],
+        }
+        return self._result
+
+    def build_times_data(self, user_map):
+        result = self._aggregate()
+        times_data = {mod["Name"]: {} for mod in self.modalidades.values()}
+        for player_id, total_ms, last_train_date, main_team_id in zip(
+            result["player_ids"], result["total_ms"], result["last_train_date"], result["main_team_id"]
+        ):
+            main_team_name = self.modalidades[main_team_id]["Name"]
+            if main_team_name in times_data:
+                times_data[main_team_name][player_id] = {
+                    "name": user_map.get(player_id, {}).get("ra", player_id),
+                    "hours": total_ms / HOUR_MS,
+                    "team": main_team_name,
+                    "last_train_date": last_train_date
+                }
+            else:
+                self.anomalies.record("unknown_main_team", {"player": player_id, "team": main_team_name})
+        return times_data
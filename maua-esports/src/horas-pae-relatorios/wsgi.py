@@ -0,0 +1,4 @@
+"""Ponto de entrada WSGI de produção: gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import app
+
+application = app